@@ -5,6 +5,7 @@ Build Silver Layer: merge per-repo bronze JSONL.gz files into train, val, and te
 
 import gzip
 import yaml
+from yaml_loader import YamlSafeLoader
 import argparse
 import sys
 import hashlib
@@ -14,7 +15,7 @@ from pathlib import Path
 def load_split_map(split_map_file: Path, bronze_repos: list) -> dict:
     if split_map_file and split_map_file.exists():
         with open(split_map_file, "r") as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=YamlSafeLoader)
     # Generate split map by hashing repo names
     splits = {"train": [], "val": [], "test": []}
     for repo in sorted(bronze_repos):
@@ -2,6 +2,7 @@ import os
 import sys
 import subprocess
 import yaml
+from yaml_loader import YamlSafeLoader
 import argparse
 import tempfile
 import platform
@@ -31,7 +32,7 @@ def load_config(config_path):
     """Loads the YAML configuration file."""
     try:
         with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=YamlSafeLoader)
         # Basic validation
         if not config:
             raise ValueError("Config file is empty.")
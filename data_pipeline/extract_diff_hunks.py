@@ -52,7 +52,8 @@ def extract_hunks_to_jsonl(diff_file_path, output_jsonl_path, pr_identifier):
                 pass
         return False
 
-if __name__ == "__main__":
+def main(argv=None):
+    """Command-line entry point. argv defaults to sys.argv[1:]; exits via sys.exit with 0 on success."""
     parser = argparse.ArgumentParser(description="Extract diff hunks from a PR's .diff file to JSONL format.")
     parser.add_argument("--input-pr-diff-file", required=True, type=Path,
                         help="Path to the input .diff file for the Pull Request.")
@@ -63,11 +64,15 @@ if __name__ == "__main__":
     # --config is not used by this script but can be accepted for consistency if called by an orchestrator
     parser.add_argument("--config", help="Optional path to a YAML configuration file (not used by this script directly).")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     args.output_jsonl_file.parent.mkdir(parents=True, exist_ok=True)
 
     if extract_hunks_to_jsonl(args.input_pr_diff_file, args.output_jsonl_file, args.pr_identifier):
         sys.exit(0)
     else:
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
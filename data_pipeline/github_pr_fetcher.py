@@ -2,20 +2,77 @@ import os
 import re
 import argparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import copy
 import yaml
+from yaml_loader import YamlSafeLoader
 import subprocess
+import tempfile
 import time
+import random
 import sys
+import itertools
 from pathlib import Path
-import tempfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from github import Github, Auth, RateLimitExceededException, GithubException
-from unidiff import PatchSet
-from io import StringIO
 import datetime
 
 # --- Configuration and Constants ---
 CHECKPOINT_FILENAME = ".fetch_checkpoint.log"
+# Review comment fields copied verbatim from the REST response into the comments JSONL.
+# 'position' may be None for outdated comments; 'side' is "RIGHT" or "LEFT".
+COMMENT_PLAIN_FIELDS = (
+    'id', 'body', 'path', 'position', 'original_position', 'commit_id',
+    'original_commit_id', 'diff_hunk', 'side', 'html_url', 'created_at', 'updated_at',
+)
+# Maximum page size the REST API allows; PyGithub's default is 30
+REST_PER_PAGE = 100
+
+DIFF_ACCEPT_HEADER = {"Accept": "application/vnd.github.v3.diff"}
+# Compiled once at import; used for every input line in batch mode
+PR_URL_PATTERN = re.compile(r"https?://(?:www\.)?github\.com/([^/]+)/([^/]+)/pull/(\d+)")
+PR_IDENTIFIER_PATTERN = re.compile(r"([^/]+)/([^/]+)/(\d+)") # 'owner/repo/number' form of --pr-identifier
+
+GITHUB_RATE_LIMIT_URL = "https://api.github.com/rate_limit"
+# Rate-limit retries per PR in batch mode before it is recorded as failed
+MAX_RATE_LIMIT_RETRIES = 6
+# Without a usable reset time, waits start here and double per retry up to RATE_LIMIT_MAX_BACKOFF
+RATE_LIMIT_MIN_BACKOFF = 30
+RATE_LIMIT_MAX_BACKOFF = 600
+# Random extra seconds per wait, so workers limited together don't all retry at the same instant
+RATE_LIMIT_JITTER_SECONDS = 10
+# REST calls a PR can cost: the diff, plus its review comments when the GraphQL prefetch misses
+REST_CALLS_PER_PR = 2
+# PRs fetched per rate-limit budget check, so a large repository waits only when the next chunk can't fit
+RATE_LIMIT_PACING_CHUNK = 100
+# Minimum seconds between /rate_limit polls; in between, the budget comes from response headers
+RATE_LIMIT_POLL_INTERVAL = 60
+# Core (REST) rate-limit budget as last reported by GitHub, updated from every session response
+rest_rate_limit_state = {"remaining": None, "limit": None, "reset": 0.0, "polled_at": 0.0}
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+# PRs per GraphQL query; 25 PRs x 100 threads x 100 comments stays well under GitHub's node limit.
+GRAPHQL_PR_BATCH_SIZE = 25
+GRAPHQL_REVIEW_THREADS_FRAGMENT = """
+fragment ReviewThreads on PullRequest {
+  reviewThreads(first: 100) {
+    pageInfo { hasNextPage }
+    nodes {
+      diffSide
+      comments(first: 100) {
+        pageInfo { hasNextPage }
+        nodes {
+          databaseId author { login } body path position originalPosition
+          commit { oid } originalCommit { oid } diffHunk createdAt updatedAt url
+        }
+      }
+    }
+  }
+}
+"""
 
 def get_github_token():
     """Retrieves the GitHub token from the environment variable."""
@@ -24,11 +81,23 @@ def get_github_token():
         raise ValueError("GitHub token not found. Set the GITHUB_TOKEN environment variable.")
     return token
 
+# Parsed configs keyed by absolute path, stored as (mtime_ns, size, config); validated once at insert
+_config_cache = {}
+
 def load_config(config_path):
-    """Loads the YAML configuration file."""
+    """
+    Loads the YAML configuration file.
+    run_online_evaluation calls main() in-process once per PR, so the parsed, validated config is cached
+    per path and reused until the file's mtime or size changes; callers get a deep copy.
+    """
     try:
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+        abs_path = os.path.abspath(config_path)
+        st = os.stat(abs_path)
+        cached = _config_cache.get(abs_path)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return copy.deepcopy(cached[2])
+        with open(abs_path, 'r') as f:
+            config = yaml.load(f, Loader=YamlSafeLoader)
         # Basic validation
         if not config:
             raise ValueError("Config file is empty.")
@@ -43,6 +112,7 @@ def load_config(config_path):
         if 'remote_raw_data_base' not in config['data_paths'] or \
            not config['data_paths']['remote_raw_data_base']:
             raise ValueError("Missing or empty 'data_paths.remote_raw_data_base' in config for remote uploads.")
+        _config_cache[abs_path] = (st.st_mtime_ns, st.st_size, copy.deepcopy(config))
         return config
     except FileNotFoundError:
         print(f"Error: Config file not found at {config_path}", file=sys.stderr)
@@ -54,246 +124,620 @@ def load_config(config_path):
         print(f"Error in config file structure: {e}", file=sys.stderr)
         sys.exit(1)
 
+def create_github_session(token: str, pool_size: int = 10) -> requests.Session:
+    """
+    Creates the requests session shared by all raw GitHub API calls, with auth headers set once.
+    The connection pool holds pool_size keep-alive connections, so every concurrent fetch thread
+    reuses one instead of opening a new connection. Transient 502/503/504s are retried with backoff;
+    rate-limit responses are left to raise_if_rate_limited and the callers' retry loops.
+    """
+    session = requests.Session()
+    retries = Retry(total=3, backoff_factor=1, status_forcelist=[502, 503, 504],
+                    allowed_methods=frozenset({"GET", "POST"}), raise_on_status=False) # POST is only used for read-only GraphQL queries
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Authorization": f"token {token}",
+        "User-Agent": "pr-fetcher/0.1 (+https://github.com/your-repo)" # Consider customizing your User-Agent
+    })
+    session.hooks['response'].append(track_rate_limit)
+    return session
+
+def track_rate_limit(response, *args, **kwargs):
+    """Session response hook: records the core rate-limit budget reported in the response headers."""
+    headers = response.headers
+    if headers.get('X-RateLimit-Resource', 'core') != 'core' or 'X-RateLimit-Remaining' not in headers:
+        return # GraphQL has its own budget; non-API responses carry none
+    try:
+        rest_rate_limit_state['remaining'] = int(headers['X-RateLimit-Remaining'])
+        rest_rate_limit_state['limit'] = int(headers.get('X-RateLimit-Limit', 0)) or None
+        rest_rate_limit_state['reset'] = float(headers.get('X-RateLimit-Reset', 0))
+    except ValueError:
+        pass
+
+def wait_for_rate_limit_budget(session: requests.Session, needed: int):
+    """
+    Sleeps until the core rate limit resets if fewer than `needed` REST calls remain, so a batch
+    paces itself instead of running into 403/429s and the retry backoff.
+    /rate_limit is only polled (at most once per RATE_LIMIT_POLL_INTERVAL, failed polls included) when the
+    headers seen so far don't already show enough budget; the poll itself does not count against the limit.
+    If the poll fails, the budget tracked by track_rate_limit is used as is.
+    Batch mode calls this per chunk of RATE_LIMIT_PACING_CHUNK PRs with the calls that chunk will make,
+    so a run only waits when the next chunk doesn't fit, not whenever a whole repository doesn't.
+    """
+    if needed <= 0:
+        return # Nothing in this chunk calls the REST API (e.g. all saved locally)
+    state = rest_rate_limit_state
+    now = time.time()
+    if (state['remaining'] is None or state['remaining'] < needed) and now - state['polled_at'] >= RATE_LIMIT_POLL_INTERVAL:
+        try:
+            response = session.get(GITHUB_RATE_LIMIT_URL, timeout=30)
+            response.raise_for_status()
+            core = response.json()['resources']['core']
+            state.update(remaining=core['remaining'], limit=core['limit'], reset=float(core['reset']), polled_at=now)
+        except (requests.exceptions.RequestException, KeyError, TypeError, ValueError) as e:
+            # Count the failed poll too, so later repositories don't re-poll a failing API every time
+            state['polled_at'] = now
+            print(f"Warning: Could not read GitHub rate limit ({e}). Pacing on the budget seen in response headers.", file=sys.stderr)
+
+    if state['limit']:
+        needed = min(needed, state['limit']) # A batch larger than a whole window can't wait for more
+    if state['remaining'] is not None and state['remaining'] < needed and state['reset'] > now:
+        wait_seconds = state['reset'] - now + 5 # Small buffer past the reset
+        print(f"Rate limit budget low ({state['remaining']} calls left, ~{needed} needed). Waiting {wait_seconds:.0f}s for the reset...")
+        time.sleep(wait_seconds)
+        state.update(remaining=None, polled_at=0.0) # Re-read the refilled budget on the next check
+
 def parse_github_pr_url(url):
     """Parses a GitHub PR URL to extract owner, repo, and PR number."""
-    match = re.match(r"https?://(?:www\.)?github\.com/([^/]+)/([^/]+)/pull/(\d+)", url)
+    match = PR_URL_PATTERN.match(url)
     if not match:
         raise ValueError(f"Invalid GitHub PR URL format: {url}")
     owner, repo, pr_number = match.groups()
     return owner, repo, int(pr_number)
 
-def fetch_pr_data(g: Github, pr_url: str):
+def fetch_pr_data(session: requests.Session, owner: str, repo_name: str, pr_number: int, diff_path: Path, prefetched_comments=None):
     """
-    Fetches the unified diff and review comments for a given GitHub PR URL.
-    Returns tuple (diff_text, comments_list, error_message) 
-    comments_list contains comment objects directly from PyGithub.
+    Fetches the unified diff and review comments for a given GitHub PR.
+    session is the shared, already-authenticated session from create_github_session.
+    Takes the already-parsed (owner, repo_name, pr_number) so URLs are parsed once by the caller.
+    If prefetched_comments (from fetch_review_comments_batch) is given, only the diff is fetched.
+    The diff is streamed straight into diff_path instead of being held in memory.
+    Returns tuple (diff_size, comments_list, error_message) 
+    diff_size is the number of diff bytes written to diff_path.
+    comments_list contains comment record dicts (see rest_comment_to_record).
     Returns (None, None, error_message) on non-rate-limit failure.
     Raises RateLimitExceededException if that specific error occurs.
     """
+    pr_label = f"{owner}/{repo_name}/pull/{pr_number}"
     try:
-        owner, repo_name, pr_number = parse_github_pr_url(pr_url)
-        print(f"Fetching data for {owner}/{repo_name}/pull/{pr_number}")
-        
-        repo = g.get_repo(f"{owner}/{repo_name}")
-        pr = repo.get_pull(pr_number)
-
         # --- Fetch diff via REST API ---
         api_diff_url = f"https://api.github.com/repos/{owner}/{repo_name}/pulls/{pr_number}"
-        token = get_github_token()
-        headers = {
-            "Authorization": f"token {token}",
-            "Accept": "application/vnd.github.v3.diff",
-            "User-Agent": "pr-fetcher/0.1 (+https://github.com/your-repo)" # Consider customizing your User-Agent
-        }
-        # Add a timeout to requests.get as well
-        diff_response = requests.get(api_diff_url, headers=headers, timeout=60) 
-        
-        if diff_response.status_code == 429:
-            print("DEBUG: Headers from diff_response (status 429):", diff_response.headers, file=sys.stderr)
-            # Pass the original headers from the diff response, which might contain Retry-After
-            raise RateLimitExceededException(status=429, data={}, headers=diff_response.headers)
-
-        diff_response.raise_for_status() # Catch other HTTP errors (404, 500, etc.)
-        diff_text = diff_response.text
-        if not diff_text:
-             print(f"Warning: Diff content for {pr_url} is empty.")
+        # Add a timeout to the diff request as well
+        # stream=True returns once the headers arrive, so errors are detected before the body is read
+        with session.get(api_diff_url, headers=DIFF_ACCEPT_HEADER, timeout=60, stream=True) as diff_response:
+            raise_if_rate_limited(diff_response)
+            diff_response.raise_for_status() # Catch other HTTP errors (404, 500, etc.)
+            diff_size = stream_response_to_file(diff_response, diff_path)
+        if not diff_size:
+             print(f"Warning: Diff content for {pr_label} is empty.")
 
         # --- Fetch Review Comments --- 
-        print("Fetching review comments...")
-        review_comments_paginated = pr.get_review_comments() # This can also raise RateLimitExceededException
-        comments_list = list(review_comments_paginated)
-        print(f"Found {len(comments_list)} review comments.")
+        if prefetched_comments is not None:
+            comments_list = prefetched_comments
+        else:
+            comments_list = fetch_review_comments_rest(session, owner, repo_name, pr_number)
 
-        return diff_text, comments_list, None
+        return diff_size, comments_list, None
 
-    except RateLimitExceededException: # Catches RLE from PyGithub calls OR from the new diff logic
+    except RateLimitExceededException: # Raised by raise_if_rate_limited for the diff or comments requests
         # The main processing loop's RateLimitExceededException handler will log and manage retries.
         raise # Re-raise the original RateLimitExceededException
-    except GithubException as ge:
-        # All other GithubExceptions (Not Found, Server Error, etc.) from get_repo, get_pull, get_review_comments
-        error_msg = f"GitHub API error fetching {pr_url}: {ge}"
-        print(error_msg, file=sys.stderr)
-        return None, None, error_msg
-    except requests.exceptions.RequestException as req_e: # From the diff requests.get if not 429 or other handled HTTP error
-        error_msg = f"Network error fetching diff for {pr_url}: {req_e}"
-        print(error_msg, file=sys.stderr)
-        return None, None, error_msg
-    except ValueError as ve: # From parse_github_pr_url
-        error_msg = f"Error parsing URL {pr_url}: {ve}"
+    except requests.exceptions.RequestException as req_e: # Network errors and non-rate-limit HTTP errors (404, 500, etc.)
+        error_msg = f"Network error fetching data for {pr_label}: {req_e}"
         print(error_msg, file=sys.stderr)
         return None, None, error_msg
     except Exception as e: # Catch-all for other unexpected errors
-        error_msg = f"Unexpected error fetching data for {pr_url}: {type(e).__name__} - {e}"
+        error_msg = f"Unexpected error fetching data for {pr_label}: {type(e).__name__} - {e}"
         print(error_msg, file=sys.stderr)
         return None, None, error_msg
 
+def stream_response_to_file(response, filename, chunk_size=1 << 16):
+    """
+    Writes a streamed response body to disk chunk by chunk, without decoding it to text.
+    Peak memory is one chunk rather than the whole body. Returns the number of bytes written.
+    The body goes to a .tmp file that is swapped in with os.replace once complete, so filename
+    only ever exists fully written (see is_pr_saved_locally).
+    """
+    tmp_path = Path(filename).with_name(Path(filename).name + '.tmp')
+    written = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                written += len(chunk)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return written
+
+def raise_if_rate_limited(response):
+    """Raises RateLimitExceededException for 429s and for 403s that report an exhausted rate limit."""
+    if response.status_code == 429 or \
+       (response.status_code == 403 and response.headers.get('X-RateLimit-Remaining') == '0'):
+        print(f"DEBUG: Headers from rate-limited response (status {response.status_code}):", response.headers, file=sys.stderr)
+        # Pass the original response headers, which might contain Retry-After
+        raise RateLimitExceededException(status=response.status_code, data={}, headers=response.headers)
+
+def rate_limit_reset_time(headers):
+    """Returns the X-RateLimit-Reset time from response headers as an aware UTC datetime, or None if absent."""
+    try:
+        return datetime.datetime.fromtimestamp(int(headers['X-RateLimit-Reset']), datetime.timezone.utc)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def tracked_rate_limit_reset_time():
+    """
+    Returns the core rate-limit reset last reported by any GitHub response (see track_rate_limit),
+    or None if none was seen or it has already passed. Lets concurrent workers that hit the limit
+    together share one reset time instead of each asking /rate_limit.
+    """
+    reset = rest_rate_limit_state['reset']
+    if reset and reset > time.time():
+        return datetime.datetime.fromtimestamp(reset, datetime.timezone.utc)
+    return None
+
+def rest_comment_to_record(comment):
+    """Projects a REST review comment JSON object onto the fields written to the comments JSONL."""
+    comment_dict = {field: comment.get(field) for field in COMMENT_PLAIN_FIELDS}
+    user = comment.get('user')
+    comment_dict['user_login'] = user['login'] if user else None
+    return comment_dict
+
+def fetch_review_comments_rest(session: requests.Session, owner: str, repo_name: str, pr_number: int) -> list:
+    """
+    Fetches all review comments of a PR from the REST API at REST_PER_PAGE comments per page,
+    following the Link header's 'next' URL. Returns comment record dicts.
+    """
+    url = f"https://api.github.com/repos/{owner}/{repo_name}/pulls/{pr_number}/comments"
+    params = {"per_page": REST_PER_PAGE}
+    records = []
+    while url:
+        response = session.get(url, params=params, timeout=60)
+        raise_if_rate_limited(response)
+        response.raise_for_status()
+        records.extend(rest_comment_to_record(comment) for comment in response.json())
+        url = response.links.get('next', {}).get('url')
+        params = None # The 'next' URL already carries per_page and page
+    return records
+
+def graphql_comment_to_record(comment, side):
+    """Converts a GraphQL review comment node (plus its thread's diffSide) into a comments JSONL record."""
+    author, commit, original_commit = comment['author'], comment['commit'], comment['originalCommit']
+    return {
+        'id': comment['databaseId'],
+        'body': comment['body'],
+        'path': comment['path'],
+        'position': comment['position'], # Might be None for outdated comments
+        'original_position': comment['originalPosition'],
+        'commit_id': commit['oid'] if commit else None,
+        'original_commit_id': original_commit['oid'] if original_commit else None,
+        'diff_hunk': comment['diffHunk'],
+        'side': side,
+        'html_url': comment['url'],
+        'user_login': author['login'] if author else None,
+        'created_at': comment['createdAt'],
+        'updated_at': comment['updatedAt'],
+    }
+
+def fetch_review_comments_batch(session: requests.Session, owner: str, repo_name: str, pr_numbers: list[int]) -> dict:
+    """
+    Fetches review comments for several PRs of one repository with batched GraphQL queries
+    (one query per GRAPHQL_PR_BATCH_SIZE PRs) instead of one REST round trip chain per PR.
+    Returns {pr_number: [comment records]} for the PRs whose comments fit in a single page;
+    PRs that are missing, truncated, or in a failed query are left out so callers fall back to REST.
+    """
+    comments_by_pr = {}
+    for start in range(0, len(pr_numbers), GRAPHQL_PR_BATCH_SIZE):
+        batch = pr_numbers[start:start + GRAPHQL_PR_BATCH_SIZE]
+        aliases = " ".join(f"pr{n}: pullRequest(number: {n}) {{ ...ReviewThreads }}" for n in batch)
+        query = f"query($owner: String!, $name: String!) {{ repository(owner: $owner, name: $name) {{ {aliases} }} }}{GRAPHQL_REVIEW_THREADS_FRAGMENT}"
+        try:
+            response = session.post(GITHUB_GRAPHQL_URL, timeout=60,
+                                    json={"query": query, "variables": {"owner": owner, "name": repo_name}})
+            response.raise_for_status()
+            repository = (response.json().get('data') or {}).get('repository') or {}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Warning: GraphQL review comment batch for {owner}/{repo_name} failed: {e}. Falling back to REST.", file=sys.stderr)
+            continue
+
+        for pr_number in batch:
+            pull_request = repository.get(f"pr{pr_number}")
+            if not pull_request:
+                continue
+            threads = pull_request['reviewThreads']
+            if threads['pageInfo']['hasNextPage'] or \
+               any(thread['comments']['pageInfo']['hasNextPage'] for thread in threads['nodes']):
+                continue # Too many comments for one page; the REST fallback paginates properly
+            records = [graphql_comment_to_record(comment, thread['diffSide'])
+                       for thread in threads['nodes'] for comment in thread['comments']['nodes']]
+            records.sort(key=lambda record: record['id']) # Match REST ordering
+            comments_by_pr[pr_number] = records
+    print(f"Prefetched review comments for {len(comments_by_pr)}/{len(pr_numbers)} PRs of {owner}/{repo_name} via GraphQL.")
+    return comments_by_pr
+
 def save_comments_to_jsonl(comments, filename):
-    """Saves a list of PyGithub comment objects to a JSON Lines file."""
+    """
+    Saves a list of comment record dicts to a JSON Lines file.
+    Written to a .tmp file and swapped in with os.replace, so a killed run never leaves a truncated file.
+    """
+    tmp_path = Path(filename).with_name(Path(filename).name + '.tmp')
     try:
-        with open(filename, 'w') as f:
-            for comment in comments:
-                # Convert comment object to a dictionary suitable for JSON
-                # Select relevant fields to avoid circular references or complex objects
-                comment_dict = {
-                    'id': comment.id,
-                    'user_login': comment.user.login if comment.user else None,
-                    'body': comment.body,
-                    'path': comment.path,
-                    'position': comment.position, # Might be None for outdated comments
-                    'original_position': comment.original_position,
-                    'commit_id': comment.commit_id,
-                    'original_commit_id': comment.original_commit_id,
-                    'diff_hunk': comment.diff_hunk,
-                    'side': comment.side,            # "RIGHT" or "LEFT"
-                    'created_at': comment.created_at.isoformat() if comment.created_at else None,
-                    'updated_at': comment.updated_at.isoformat() if comment.updated_at else None,
-                    'html_url': comment.html_url,
-                    # Add other fields if needed
-                }
-                json.dump(comment_dict, f)
-                f.write('\n')
-        print(f"Saved {len(comments)} comments to {filename}")
+        # Serialize every line first, then hand them to the file in one writelines call
+        lines = [json.dumps(comment_dict) + '\n' for comment_dict in comments]
+        with open(tmp_path, 'w', buffering=1 << 20) as f:
+            f.writelines(lines)
+        os.replace(tmp_path, filename)
         return True
     except Exception as e:
         print(f"Error saving comments to {filename}: {e}", file=sys.stderr)
+        tmp_path.unlink(missing_ok=True)
         return False
 
-def find_hunk_and_line_for_comment(parsed_diff, comment_path, comment_pos):
+# --- New Helper Functions for Checkpointing and Batching ---
+
+def checkpoint_repo_key(owner: str, repo_name: str) -> str:
     """
-    Finds the specific hunk and line object in the parsed diff corresponding
-    to a comment path and position.
-    Returns a tuple (hunk, line) or (None, None) if not found.
+    Returns the checkpoint key for a repository. GitHub owner/repo names are case-insensitive,
+    so keys are lowercased (the same folding input dedup uses) and Foo/Bar#1 matches foo/bar#1.
     """
-    if not comment_path or comment_pos is None or comment_pos <= 0:
-        return None, None
-
-    target_file = None
-    # Find target_file logic (same as before)...
-    for file_diff in parsed_diff:
-        if file_diff.path == comment_path:
-            target_file = file_diff
-            break
-    if not target_file: # Add fallback if needed
-        # ... fallback logic ...
-        if not target_file:
-             return None, None
-
-
-    current_pos_count = 0
-    for hunk in target_file: # Iterate through hunks
-        for line in hunk: # Iterate through lines within the hunk
-            if line.is_context or line.is_added:
-                current_pos_count += 1
-                if current_pos_count == comment_pos:
-                    # Found the line, return it AND the current hunk
-                    return hunk, line
-
-    # If loop completes without finding the position
-    return None, None
-
-# --- New Helper Functions for Checkpointing and Batching ---
+    return f"{owner}/{repo_name}".lower()
 
 def load_checkpoint(checkpoint_path: Path) -> dict:
-    """Loads the checkpoint file (JSON) into a dictionary."""
-    if checkpoint_path.exists():
+    """
+    Loads the checkpoint file into a dictionary of repo_key -> set of PR numbers, keyed by checkpoint_repo_key.
+    The file is an append-only JSON Lines log with one {"r": repo_key, "n": pr_number} entry per
+    checkpointed PR. A legacy single-document JSON snapshot, or a log with many duplicate entries,
+    is rewritten once as a compact log.
+    Malformed lines (e.g. a final line torn by a crash mid-append) are skipped with a warning and
+    dropped by the same rewrite, so a crash costs at most the entry being written.
+    """
+    if not checkpoint_path.exists():
+        return {}
+    try:
+        with open(checkpoint_path, 'r') as f:
+            text = f.read()
+        processed = {}
         try:
-            with open(checkpoint_path, 'r') as f:
-                return json.load(f)
+            legacy_snapshot = json.loads(text)
         except json.JSONDecodeError:
-            print(f"Warning: Checkpoint file {checkpoint_path} is corrupted. Starting fresh.", file=sys.stderr)
-            return {}
-        except Exception as e:
-            print(f"Warning: Could not read checkpoint file {checkpoint_path}: {e}. Starting fresh.", file=sys.stderr)
-            return {}
-    return {}
+            legacy_snapshot = None # Several lines: the normal append-only log
+        if isinstance(legacy_snapshot, dict) and all(isinstance(v, list) for v in legacy_snapshot.values()):
+            for repo_key, pr_numbers in legacy_snapshot.items():
+                processed.setdefault(repo_key.lower(), set()).update(pr_numbers)
+            entry_count = None
+        else:
+            entry_count = 0
+            malformed_count = 0
+            for line in text.splitlines():
+                if line.strip():
+                    try:
+                        entry = json.loads(line)
+                        processed.setdefault(entry['r'].lower(), set()).add(entry['n']) # Logs may predate lowercased keys
+                        entry_count += 1
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        malformed_count += 1
+            if malformed_count:
+                print(f"Warning: Skipped {malformed_count} malformed entries in checkpoint file {checkpoint_path}.", file=sys.stderr)
+                entry_count = None # Rewrite without them
+        if entry_count is None or entry_count > 2 * sum(len(prs) for prs in processed.values()):
+            write_checkpoint_snapshot(checkpoint_path, processed)
+        return processed
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print(f"Warning: Checkpoint file {checkpoint_path} is corrupted. Starting fresh.", file=sys.stderr)
+        return {}
+    except Exception as e:
+        print(f"Warning: Could not read checkpoint file {checkpoint_path}: {e}. Starting fresh.", file=sys.stderr)
+        return {}
+
+def _checkpoint_lines(entries):
+    """Formats (repo_key, pr_number) pairs as checkpoint log lines."""
+    return [json.dumps({"r": repo_key, "n": pr_number}) + '\n' for repo_key, pr_number in entries]
+
+def write_checkpoint_snapshot(checkpoint_path: Path, processed_data: dict):
+    """
+    Rewrites the checkpoint log from scratch with one entry per processed PR (used for compaction).
+    The new log is written and fsynced beside the old one, then swapped in with os.replace,
+    so a crash mid-compaction leaves the previous log intact instead of a truncated one.
+    """
+    entries = [(repo_key, pr_number) for repo_key, pr_numbers in processed_data.items() for pr_number in sorted(pr_numbers)]
+    tmp_path = checkpoint_path.with_name(checkpoint_path.name + '.tmp')
+    try:
+        with open(tmp_path, 'w') as f:
+            f.writelines(_checkpoint_lines(entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, checkpoint_path)
+    except Exception as e:
+        print(f"Error compacting checkpoint {checkpoint_path}: {e}", file=sys.stderr)
+        tmp_path.unlink(missing_ok=True)
 
-def save_checkpoint(checkpoint_path: Path, processed_data: dict):
-    """Saves the processed data dictionary to the checkpoint file (JSON)."""
+def append_checkpoint_entries(checkpoint_path: Path, entries: list[tuple[str, int]]):
+    """
+    Appends newly processed (repo_key, pr_number) pairs to the checkpoint log.
+    Cost is proportional to the new entries only, not to everything checkpointed so far.
+    """
     try:
         checkpoint_path.parent.mkdir(parents=True, exist_ok=True) # Ensure directory exists
-        with open(checkpoint_path, 'w') as f:
-            json.dump(processed_data, f, indent=2)
-        print(f"Checkpoint saved to {checkpoint_path}")
+        with open(checkpoint_path, 'a') as f:
+            f.writelines(_checkpoint_lines(entries))
+        print(f"Checkpoint updated with {len(entries)} PRs at {checkpoint_path}")
     except Exception as e:
         print(f"Error saving checkpoint to {checkpoint_path}: {e}", file=sys.stderr)
 
+def checkpoint_fetched_prs(checkpoint_path: Path, processed_prs_by_repo: dict, fetched_prs_by_repo: dict) -> list[tuple[str, str, int]]:
+    """
+    Marks the fetched (and uploaded) PRs of each repository as processed, both in memory and in the checkpoint log.
+    Returns the lowercased (owner, repo_name, pr_number) of the PRs newly checkpointed, matching group_prs_by_repository's parsed PRs.
+    """
+    newly_checkpointed_entries = []
+    newly_checkpointed_prs = []
+    for repo_key, fetched_prs in fetched_prs_by_repo.items():
+        owner, repo_name = repo_key.split('/', 1)
+        print(f"Updating checkpoint for repository {owner}/{repo_name}...")
+        checkpoint_key = checkpoint_repo_key(owner, repo_name)
+        checkpoint_owner, checkpoint_repo_name = checkpoint_key.split('/', 1)
+        checkpointed_pr_numbers = processed_prs_by_repo.setdefault(checkpoint_key, set())
+
+        newly_checkpointed_count_for_repo = 0
+        for pr_data in fetched_prs:
+            # Add to checkpoint only if not already there (though skip logic should prevent this)
+            if pr_data["pr_number"] not in checkpointed_pr_numbers:
+                checkpointed_pr_numbers.add(pr_data["pr_number"])
+                newly_checkpointed_entries.append((checkpoint_key, pr_data["pr_number"]))
+                newly_checkpointed_prs.append((checkpoint_owner, checkpoint_repo_name, pr_data["pr_number"]))
+                newly_checkpointed_count_for_repo += 1
+
+        if newly_checkpointed_count_for_repo == 0:
+            print(f"No new PRs to checkpoint for {owner}/{repo_name} in this batch.")
+
+    if newly_checkpointed_entries:
+        append_checkpoint_entries(checkpoint_path, newly_checkpointed_entries)
+    return newly_checkpointed_prs
+
 def is_pr_processed(owner: str, repo_name: str, pr_number: int, processed_prs_by_repo: dict) -> bool:
     """Checks if a PR is marked as processed in the checkpoint data."""
-    repo_key = f"{owner}/{repo_name}"
-    return repo_key in processed_prs_by_repo and pr_number in processed_prs_by_repo[repo_key]
+    return pr_number in processed_prs_by_repo.get(checkpoint_repo_key(owner, repo_name), ())
+
+def get_pr_local_paths(pr_output_dir: Path, owner: str, repo_name: str, pr_number: int) -> tuple[Path, Path]:
+    """Returns the (diff_path, comments_path) a PR's raw data is saved to under pr_output_dir."""
+    file_basename = f"{owner}_{repo_name}_{pr_number}"
+    return pr_output_dir / f"{file_basename}.diff", pr_output_dir / f"{file_basename}_comments.jsonl"
+
+def is_pr_saved_locally(local_diff_path: Path, local_comments_path: Path) -> bool:
+    """
+    Checks if a PR's raw files from an earlier, interrupted run are already on disk.
+    Both files are written via .tmp + os.replace, so existing means complete (an empty diff included);
+    the comments file is written after the diff, so its presence marks a complete save.
+    Only file metadata is inspected, never the file contents.
+    """
+    return os.path.isfile(local_comments_path) and os.path.isfile(local_diff_path)
+
+def fetch_and_save_pr(g: Github, session: requests.Session, pr_info: dict, pr_output_dir: Path, prefetched_comments=None):
+    """
+    Fetches one PR (retrying on rate limits) and saves its diff and comments under pr_output_dir.
+    prefetched_comments is forwarded to fetch_pr_data when the comments were already batch-fetched.
+    Safe to run from worker threads: it only touches this PR's own files.
+    Returns the saved-PR record dict on success, or None on failure (errors are logged).
+    """
+    pr_url = pr_info['url']
+    owner, repo_name, pr_number = pr_info['owner'], pr_info['repo'], pr_info['pr_number']
+
+    local_diff_path, local_comments_path = get_pr_local_paths(pr_output_dir, owner, repo_name, pr_number)
+    saved_pr = {
+        "owner": owner, "repo": repo_name, "pr_number": pr_number,
+        "diff_path": local_diff_path, "comments_path": local_comments_path
+    }
+
+    try:
+        # Resumed run: files saved by an earlier run that died before checkpointing
+        # only need to be uploaded (rclone copy skips objects already on the remote).
+        if is_pr_saved_locally(local_diff_path, local_comments_path):
+            print(f"Raw data for {pr_url} already saved locally. Skipping fetch.")
+            return saved_pr
+
+        # --- Inner retry loop for fetching data for a single PR ---
+        diff_size, comments_list, error_msg = None, None, None # Ensure these are defined before the loop
+        rate_limit_retries = 0
+
+        while True: # This loop handles retries for a single PR
+            try:
+                # error_msg is only set by fetch_pr_data for non-RLE, non-fatal errors it returns.
+                diff_size, comments_list, error_msg = fetch_pr_data(session, owner, repo_name, pr_number, local_diff_path, prefetched_comments)
+
+                if error_msg: # Any error message from fetch_pr_data that indicates failure to retrieve data
+                     # This will be caught by the PR processing exception handler below
+                     raise Exception(f"fetch_pr_data for {pr_url} returned an error: {error_msg}")
+
+                break # Success from fetch_pr_data, exit retry loop for this PR
+
+            except RateLimitExceededException as rle_inner:
+                # This is for PRIMARY GitHub API rate limits or if fetch_pr_data raised it due to Retry-After on diff
+                if rate_limit_retries >= MAX_RATE_LIMIT_RETRIES:
+                    raise Exception(f"Still rate limited after {MAX_RATE_LIMIT_RETRIES} retries for {pr_url}")
+                print(f"RateLimitExceededException caught for {pr_url}. Determining wait time...", file=sys.stderr)
 
-def group_prs_by_repository(pr_urls: list[str]) -> dict[str, list[dict]]:
-    """Groups PR URLs by repository, storing parsed details."""
-    grouped = {}
+                # Check if the exception's headers (potentially from diff_response) have Retry-After
+                specific_retry_after = None
+                if rle_inner.headers and 'Retry-After' in rle_inner.headers:
+                    try:
+                        specific_retry_after = int(rle_inner.headers['Retry-After'])
+                        print(f"RateLimitExceededException for {pr_url} included Retry-After: {specific_retry_after}s.", file=sys.stderr)
+                    except ValueError:
+                        print(f"RateLimitExceededException for {pr_url} had unparsable Retry-After: {rle_inner.headers['Retry-After']}.", file=sys.stderr)
+
+                if specific_retry_after is not None and specific_retry_after > 0:
+                    wait_seconds = specific_retry_after + 5 # Add a small buffer
+                    reset_time_for_log = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=wait_seconds)
+                    print(f"Waiting {wait_seconds:.0f}s based on specific Retry-After header from exception for {pr_url} (until ~{reset_time_for_log})...")
+                else:
+                    # Fallback to general GitHub API rate limit reset time
+                    print(f"No specific Retry-After in RLE for {pr_url} or it was invalid. Using general GitHub API reset time.", file=sys.stderr)
+                    # The rate-limited response (or any recent one) already reports the reset time; only ask the API if none did
+                    reset_time = rate_limit_reset_time(rle_inner.headers) or tracked_rate_limit_reset_time()
+                    if reset_time is None:
+                        try:
+                            rate_limit_info = g.get_rate_limit().core # core, search, graphql, etc.
+                            reset_time = rate_limit_info.reset
+                        except Exception as e_rl:
+                            print(f"Could not get primary rate limit info: {e_rl}. Waiting default 120s.", file=sys.stderr)
+                            reset_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=120)
+                    # Add buffer; the minimum wait doubles per retry for limits whose reset has already passed (secondary limits)
+                    backoff_floor = min(RATE_LIMIT_MIN_BACKOFF * 2 ** rate_limit_retries, RATE_LIMIT_MAX_BACKOFF)
+                    wait_seconds = max((reset_time - datetime.datetime.now(datetime.timezone.utc)).total_seconds() + 15, backoff_floor)
+
+                wait_seconds += random.uniform(0, RATE_LIMIT_JITTER_SECONDS)
+                rate_limit_retries += 1
+                print(f"Overall rate limit policy for {pr_url}: Waiting for {wait_seconds:.0f} seconds (retry {rate_limit_retries}/{MAX_RATE_LIMIT_RETRIES})...")
+                time.sleep(wait_seconds)
+                # Loop will continue to retry fetching this PR's data
+
+        # --- End of inner retry loop ---
+        if diff_size is None: # Should not happen if loop logic is correct and fetch_pr_data succeeded
+            print(f"Error: diff_size is None for {pr_url} after fetch attempts. Skipping save.", file=sys.stderr)
+            raise Exception(f"diff_size was None for {pr_url} unexpectedly.")
+
+        if not save_comments_to_jsonl(comments_list, local_comments_path):
+             raise Exception(f"Failed to save comments locally for {pr_url}")
+
+        # One line per successful PR; errors and rate-limit waits above are still reported individually
+        print(f"Saved PR {pr_url}: {diff_size} diff bytes, {len(comments_list)} review comments")
+        return saved_pr
+
+    except GithubException as ge:
+        print(f"GitHub API error processing PR {pr_url}: {ge}. Will not be added to current batch.", file=sys.stderr)
+    except Exception as pr_e:
+        print(f"Error processing PR {pr_url}: {pr_e}. Will not be added to current batch.", file=sys.stderr)
+    return None
+
+def group_prs_by_repository(pr_urls: list[str], processed_prs_by_repo: dict = None) -> tuple[dict[str, list[dict]], list[tuple[str, str, int]]]:
+    """
+    Groups PR URLs by repository, storing parsed details.
+    PRs already in processed_prs_by_repo (the checkpoint) are left out, so only PRs needing work are grouped.
+    Also returns (owner, repo, pr_number) for every valid input URL, checkpointed or not, so callers don't reparse them;
+    owner and repo are lowercased like checkpoint_repo_key, so they compare directly with checkpointed PRs.
+    Duplicate URLs (and different URLs of the same PR, including owner/repo case differences,
+    which GitHub ignores) are parsed and grouped once, under the first form seen.
+    """
+    grouped = defaultdict(list)
+    parsed_prs = []
+    seen_urls = set()
+    seen_prs = set()
+    already_processed_count = 0
+    duplicate_count = 0
     for url in pr_urls:
-        try:
-            owner, repo, pr_number = parse_github_pr_url(url)
-            repo_key = f"{owner}/{repo}"
-            if repo_key not in grouped:
-                grouped[repo_key] = []
-            grouped[repo_key].append({'url': url, 'owner': owner, 'repo': repo, 'pr_number': pr_number})
-        except ValueError:
+        if url in seen_urls:
+            duplicate_count += 1
+            continue
+        seen_urls.add(url)
+        # Match inline rather than via parse_github_pr_url so invalid URLs don't raise/catch per line
+        match = PR_URL_PATTERN.match(url)
+        if not match:
             print(f"Skipping invalid PR URL during grouping: {url}", file=sys.stderr)
-    return grouped
-
-def upload_repository_batch_to_s3(config: dict, local_repo_data_path: Path, owner: str, repo_name: str) -> bool:
+            continue
+        owner, repo, pr_number = match.groups()
+        pr_number = int(pr_number)
+        pr_key = (owner.lower(), repo.lower(), pr_number)
+        if pr_key in seen_prs:
+            duplicate_count += 1
+            continue # Same PR under another URL form; fetching it twice would race on the same files
+        seen_prs.add(pr_key)
+        parsed_prs.append(pr_key)
+        if processed_prs_by_repo and is_pr_processed(owner, repo, pr_number, processed_prs_by_repo):
+            already_processed_count += 1
+            continue
+        grouped[f"{owner}/{repo}"].append({'url': url, 'owner': owner, 'repo': repo, 'pr_number': pr_number})
+    if duplicate_count:
+        print(f"Dropped {duplicate_count} duplicate PR URLs from the input list.")
+    if already_processed_count:
+        print(f"Skipping {already_processed_count} PRs already processed according to checkpoint.")
+    return grouped, parsed_prs
+
+def upload_repositories_to_s3(config: dict, local_output_path: Path, fetched_prs_by_repo: dict) -> bool:
     """
-    Uploads all files in the local_repo_data_path for a specific repository to S3 using rclone.
-    The S3 path will be <rclone_remote_name>:<s3_target_path>/<owner>/<repo_name>/
+    Uploads the PR files saved for several repositories to S3 with a single rclone run, so rclone's
+    startup, config parsing and remote auth are paid once instead of once per repository.
+    Only the given PRs' diff and comments files are sent (listed in a --files-from manifest), so files
+    left in the same directories by earlier runs aren't checked against the remote again.
+    Files under <local_output_path>/<owner>/<repo_name>/ go to
+    <rclone_remote_name>:<s3_target_path>/<owner>/<repo_name>/
     """
     rclone_remote = config['rclone_remote_name']
     s3_base_path = config['data_paths']['remote_raw_data_base'].strip('/') # Ensure no leading/trailing slashes for joining
-    
-    # Corrected remote_path construction
-    remote_path = f"{rclone_remote}:{s3_base_path}/{owner}/{repo_name}"
-    
-    # local_repo_data_path already points to .../owner/repo_name, so we just append /
-    # to copy its contents.
-    source_path_for_rclone = str(local_repo_data_path) + ("" if str(local_repo_data_path).endswith('/') else "/")
-
-
-    if not local_repo_data_path.exists() or not any(local_repo_data_path.iterdir()):
-        print(f"No files found in {local_repo_data_path} to upload for {owner}/{repo_name}. Skipping S3 upload.", file=sys.stdout)
+    remote_path = f"{rclone_remote}:{s3_base_path}"
+
+    # Manifest paths are relative to the copy source, i.e. <owner>/<repo_name>/<file>
+    manifest_paths = [
+        Path(file_path).relative_to(local_output_path).as_posix()
+        for saved_prs in fetched_prs_by_repo.values()
+        for saved_pr in saved_prs
+        for file_path in (saved_pr['diff_path'], saved_pr['comments_path'])
+        if os.path.isfile(file_path)
+    ]
+    if not manifest_paths:
+        print(f"No files found in {local_output_path} to upload for {len(fetched_prs_by_repo)} repositories. Skipping S3 upload.", file=sys.stdout)
         return True # Nothing to upload, so "success"
 
+    with tempfile.NamedTemporaryFile('w', prefix='rclone_files_', suffix='.txt', delete=False) as manifest_file:
+        manifest_file.write('\n'.join(manifest_paths) + '\n')
+    manifest_path = manifest_file.name
+
     cmd = [
         "rclone", "copy", "--retries", "3", "--retries-sleep", "10s",
         "--progress",
         "--transfers=32",
         "--checkers=16",
         "--multi-thread-streams=4",
-        "--fast-list",
-        str(source_path_for_rclone), # Source: local directory for the repo
-        remote_path # Destination: S3 path for the repo
+        # Write-mostly upload: check each source file on its own instead of listing the destination,
+        # and skip the bucket existence HEAD/create on every run.
+        "--no-traverse",
+        "--s3-no-check-bucket",
+        "--ignore-existing", # Raw PR files are write-once; an object already on S3 needs no size/modtime comparison
+        "--files-from", manifest_path,
+        str(local_output_path) + "/", # Source: local output root holding <owner>/<repo_name>/ directories
+        remote_path # Destination: S3 base path
     ]
-    print(f"Attempting to upload batch for {owner}/{repo_name} to {remote_path} using command: {' '.join(cmd)}")
+    print(f"Attempting to upload {len(manifest_paths)} files from {len(fetched_prs_by_repo)} repositories to {remote_path} using command: {' '.join(cmd)}")
     try:
         # Add timeout to rclone command
         result = subprocess.run(cmd, capture_output=True, text=True, check=False, timeout=1800) # 30 min timeout
         if result.returncode == 0:
-            print(f"Successfully uploaded batch for {owner}/{repo_name} to {remote_path}")
-            # Potentially list files:
-            # list_cmd = ["rclone", "ls", remote_path]
-            # list_result = subprocess.run(list_cmd, capture_output=True, text=True, check=False)
-            # print(f"Uploaded files:\n{list_result.stdout}")
+            print(f"Successfully uploaded {len(manifest_paths)} files from {len(fetched_prs_by_repo)} repositories to {remote_path}")
             return True
         else:
-            print(f"Error uploading batch for {owner}/{repo_name} to {remote_path}.", file=sys.stderr)
+            print(f"Error uploading repositories to {remote_path}.", file=sys.stderr)
             print(f"Rclone stdout:\n{result.stdout}", file=sys.stderr)
             print(f"Rclone stderr:\n{result.stderr}", file=sys.stderr)
             return False
     except subprocess.TimeoutExpired:
-        print(f"Rclone command timed out for {owner}/{repo_name}.", file=sys.stderr)
+        print(f"Rclone command timed out uploading to {remote_path}.", file=sys.stderr)
         return False
     except FileNotFoundError:
         print("Error: rclone command not found. Please ensure rclone is installed and in your PATH.", file=sys.stderr)
         return False
     except Exception as e:
-        print(f"An unexpected error occurred during rclone execution for {owner}/{repo_name}: {e}", file=sys.stderr)
+        print(f"An unexpected error occurred during rclone execution for {remote_path}: {e}", file=sys.stderr)
         return False
+    finally:
+        os.unlink(manifest_path)
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Command-line entry point. argv defaults to sys.argv[1:]; exits via sys.exit like a script run,
+    so in-process callers (run_online_evaluation.py) catch SystemExit for the exit code.
+    """
     parser = argparse.ArgumentParser(description="Fetch GitHub PR diff and comments, save raw data, and upload to S3.")
     parser.add_argument("--config", required=True, help="Path to the YAML configuration file.")
     parser.add_argument("--input-pr-list", required=False, help="Path to a text file containing PR URLs to process, one URL per line. Ignored if --pr-identifier is set.")
@@ -301,7 +745,8 @@ if __name__ == "__main__":
     parser.add_argument("--debug", action="store_true", help="Enable debug mode with more verbose output")
     parser.add_argument("--local-output-dir", required=True, help="Directory to save the raw diff and comment files locally.")
     parser.add_argument("--skip-remote-upload", action="store_true", help="Skip uploading files to S3 remote.")
-    args = parser.parse_args()
+    parser.add_argument("--max-workers", type=int, default=8, help="Maximum number of PRs fetched concurrently in batch mode.")
+    args = parser.parse_args(argv)
 
     # --- Load Config ---
     config = load_config(args.config)
@@ -321,6 +766,8 @@ if __name__ == "__main__":
         token = get_github_token()
         auth = Auth.Token(token)
         g = Github(auth=auth, retry=5, timeout=60) # Increased timeout for Github client
+        # One keep-alive session for the raw REST/GraphQL calls, so TCP/TLS setup is reused across PRs
+        session = create_github_session(token, pool_size=max(args.max_workers, 10))
         print("GitHub client initialized.")
         # Avoid printing user login immediately if in single PR mode where it might fail early
     except Exception as e:
@@ -345,7 +792,7 @@ if __name__ == "__main__":
                 owner, repo_name, pr_number_int = parse_github_pr_url(args.pr_identifier)
                 pr_url_to_fetch = args.pr_identifier
             else:
-                match = re.match(r"([^/]+)/([^/]+)/(\d+)", args.pr_identifier)
+                match = PR_IDENTIFIER_PATTERN.match(args.pr_identifier)
                 if not match:
                     raise ValueError(f"Invalid PR identifier format: \'{args.pr_identifier}\'. Expected \'owner/repo/number\' or a full URL.")
                 owner, repo_name, pr_number_str = match.groups()
@@ -361,7 +808,7 @@ if __name__ == "__main__":
             local_diff_path = local_output_path / f"{file_basename}.diff"
             local_comments_path = local_output_path / f"{file_basename}_comments.jsonl"
 
-            diff_text, comments_list, error_msg = None, None, None
+            diff_size, comments_list, error_msg = None, None, None
             fetch_attempts = 0
             max_fetch_attempts = 3
 
@@ -369,7 +816,7 @@ if __name__ == "__main__":
                 fetch_attempts += 1
                 try:
                     print(f"Attempt {fetch_attempts}/{max_fetch_attempts} to fetch data for {pr_url_to_fetch}")
-                    diff_text, comments_list, error_msg = fetch_pr_data(g, pr_url_to_fetch)
+                    diff_size, comments_list, error_msg = fetch_pr_data(session, owner, repo_name, pr_number_int, local_diff_path)
                     if error_msg:
                         print(f"fetch_pr_data for {pr_url_to_fetch} returned an error: {error_msg}", file=sys.stderr)
                         if fetch_attempts < max_fetch_attempts:
@@ -391,8 +838,7 @@ if __name__ == "__main__":
                         wait_seconds = specific_retry_after + 5 
                     else:
                         try:
-                            rate_limit_info = g.get_rate_limit().core
-                            reset_time = rate_limit_info.reset
+                            reset_time = rate_limit_reset_time(rle_inner.headers) or tracked_rate_limit_reset_time() or g.get_rate_limit().core.reset
                             wait_seconds = max((reset_time - datetime.datetime.now(datetime.timezone.utc)).total_seconds() + 15, 30)
                         except Exception as e_rl:
                             print(f"Could not get primary rate limit info: {e_rl}. Waiting default 60s.", file=sys.stderr)
@@ -404,16 +850,15 @@ if __name__ == "__main__":
                     else:
                         print(f"Max retries reached for {pr_url_to_fetch} due to rate limiting.", file=sys.stderr)
                         raise 
-            if diff_text is None: 
-                print(f"Error: diff_text is None for {pr_url_to_fetch} after all fetch attempts. Exiting.", file=sys.stderr)
+            if diff_size is None: 
+                print(f"Error: diff_size is None for {pr_url_to_fetch} after all fetch attempts. Exiting.", file=sys.stderr)
                 sys.exit(1)
 
-            print(f"Saving diff locally to {local_diff_path}")
-            with open(local_diff_path, 'w', encoding='utf-8') as f_diff:
-                f_diff.write(diff_text)
-            print(f"DEBUG FETCHER: Wrote {len(diff_text) if diff_text else 'None'} bytes for {pr_url_to_fetch}. Path: {local_diff_path.resolve()}. Exists: {local_diff_path.exists()}") # DEBUG LINE
+            print(f"Saved diff locally to {local_diff_path}")
+            if args.debug:
+                print(f"Wrote {diff_size} bytes for {pr_url_to_fetch} to {local_diff_path.resolve()}")
 
-            print(f"Saving comments locally to {local_comments_path}")
+            print(f"Saving {len(comments_list)} comments locally to {local_comments_path}")
             save_comments_to_jsonl(comments_list, local_comments_path) # Allow empty comments, returns True/False but we don't check strictly here for online eval
             print(f"Note: Comments file {local_comments_path} saved (may be empty if no review comments).")
 
@@ -446,11 +891,9 @@ if __name__ == "__main__":
         # --- Read PR List ---
         all_input_pr_urls = []
         try:
+            # One read and split, then strip/filter in a comprehension rather than a per-line loop
             with open(args.input_pr_list, 'r') as f:
-                for line in f:
-                    url = line.strip()
-                    if url:
-                        all_input_pr_urls.append(url)
+                all_input_pr_urls = [url for url in map(str.strip, f.read().splitlines()) if url]
             print(f"Read {len(all_input_pr_urls)} PR URLs from {args.input_pr_list}")
         except FileNotFoundError:
             print(f"Error: Input PR list file not found at {args.input_pr_list}", file=sys.stderr)
@@ -463,11 +906,15 @@ if __name__ == "__main__":
             print("No PR URLs found in the input file. Exiting.")
             sys.exit(0)
         
-        # --- Group PRs by Repository ---
-        prs_grouped_by_repository = group_prs_by_repository(all_input_pr_urls)
-        if not prs_grouped_by_repository:
-            print("No valid PR URLs to process after grouping. Exiting.")
+        # --- Group PRs by Repository (checkpointed PRs are dropped here, before the fetch loop) ---
+        prs_grouped_by_repository, all_input_prs_parsed_details = group_prs_by_repository(all_input_pr_urls, processed_prs_by_repo_checkpoint)
+        if not all_input_prs_parsed_details:
+            # Nothing valid to compare against, so the checkpoint (and its progress) must be left alone
+            print("No valid PR URLs found in the input file. Exiting.")
             sys.exit(0)
+        if not prs_grouped_by_repository:
+            # Fall through so a fully checkpointed input still gets its checkpoint cleaned up below.
+            print("No PRs left to process after grouping (invalid or already checkpointed).")
 
         # --- Processing Loop ---
         overall_success_count = 0
@@ -475,204 +922,116 @@ if __name__ == "__main__":
         
         # Store all successfully processed PRs (owner, repo, number) across all batches in this run
         # to later compare with all_input_pr_urls for checkpoint deletion.
+        # Populated from the existing checkpoint; the repo key is split once per repository, not per PR
         all_prs_fully_processed_in_this_run_or_before = set()
-        # Populate from existing checkpoint
         for repo_key_chk, pr_nums_chk in processed_prs_by_repo_checkpoint.items():
             owner_chk, repo_name_chk = repo_key_chk.split('/', 1)
-            for pr_num_chk in pr_nums_chk:
-                all_prs_fully_processed_in_this_run_or_before.add((owner_chk, repo_name_chk, pr_num_chk))
+            all_prs_fully_processed_in_this_run_or_before.update(
+                zip(itertools.repeat(owner_chk), itertools.repeat(repo_name_chk), pr_nums_chk)
+            )
 
+        # Uploads run on a single background worker so they overlap the next repository's fetch.
+        # Repositories fetched while an upload is in flight queue up and go out together in the next rclone run.
+        uploader = None if args.skip_remote_upload else ThreadPoolExecutor(max_workers=1)
+        in_flight_upload = None # (future, {repo_key: saved PRs}) currently being uploaded
+        awaiting_upload = {} # Saved PRs per repository not yet handed to the uploader
 
         for repo_key, pr_details_list in prs_grouped_by_repository.items():
             owner, repo_name = repo_key.split('/', 1)
             print(f"\n--- Processing Repository: {owner}/{repo_name} ---")
+            # Define local paths within the base output directory, organized by owner/repo.
+            # Each repository appears once in the grouping, so this runs once per repository.
+            pr_specific_output_dir = local_output_path / owner / repo_name
+            pr_specific_output_dir.mkdir(parents=True, exist_ok=True)
 
             repo_batch_successfully_fetched_and_saved = [] # List of (owner, repo, pr_number, diff_path, comments_path)
             repo_batch_had_errors = False
-
-            for pr_info in pr_details_list:
-                pr_url = pr_info['url']
-                pr_number = pr_info['pr_number']
-                
-                print("-"*40)
-                print(f"Processing PR: {pr_url}")
-
-                if is_pr_processed(owner, repo_name, pr_number, processed_prs_by_repo_checkpoint):
-                    print(f"PR {pr_url} already processed according to checkpoint. Skipping.")
-                    all_prs_fully_processed_in_this_run_or_before.add((owner, repo_name, pr_number)) # Ensure it's counted
-                    # No need to increment overall_success_count here as it's from a previous run.
-                    # We only count successes for PRs processed *in this current run*.
-                    continue
-
-                pr_processed_successfully_this_iteration = False
-                local_diff_path = None
-                local_comments_path = None
-                
-                try:
-                    # file_basename for this PR
-                    file_basename = f"{owner}_{repo_name}_{pr_number}"
-                    
-                    # Define local paths within the base output directory, organized by owner/repo
-                    pr_specific_output_dir = local_output_path / owner / repo_name
-                    pr_specific_output_dir.mkdir(parents=True, exist_ok=True)
-                    local_diff_path = pr_specific_output_dir / f"{file_basename}.diff"
-                    local_comments_path = pr_specific_output_dir / f"{file_basename}_comments.jsonl"
-
-                    # Fetch data (with rate limit retry loop)
-                    # --- Inner retry loop for fetching data for a single PR ---
-                    # max_diff_fetch_retries and current_diff_fetch_retry are removed as the
-                    # specific error message they handled is no longer returned by fetch_pr_data.
-                    # RateLimitExceededException will be caught and handled by the outer loop's mechanism.
-                    
-                    diff_text, comments_list, error_msg = None, None, None # Ensure these are defined before the loop
-
-                    while True: # This loop handles retries for a single PR
-                        try:
-                            # error_msg is now only set by fetch_pr_data for non-RLE, non-fatal errors it returns.
-                            # If fetch_pr_data raises an exception (like RLE), it's caught below.
-                            # If it returns an error_msg, it's handled after the call.
-                            
-                            diff_text, comments_list, error_msg = fetch_pr_data(g, pr_url)
-                            
-                            if error_msg: # Any error message from fetch_pr_data that indicates failure to retrieve data
-                                 # This will be caught by the outer PR processing exception handler
-                                 raise Exception(f"fetch_pr_data for {pr_url} returned an error: {error_msg}")
-                                
-                            # If no error_msg and no exception, it means success
-                            break # Success from fetch_pr_data, exit retry loop for this PR
-
-                        except RateLimitExceededException as rle_inner: 
-                            # This is for PRIMARY GitHub API rate limits or if fetch_pr_data raised it due to Retry-After on diff
-                            print(f"RateLimitExceededException caught for {pr_url}. Determining wait time...", file=sys.stderr)
-                            
-                            # Check if the exception's headers (potentially from diff_response) have Retry-After
-                            specific_retry_after = None
-                            if rle_inner.headers and 'Retry-After' in rle_inner.headers:
-                                try:
-                                    specific_retry_after = int(rle_inner.headers['Retry-After'])
-                                    print(f"RateLimitExceededException for {pr_url} included Retry-After: {specific_retry_after}s.", file=sys.stderr)
-                                except ValueError:
-                                    print(f"RateLimitExceededException for {pr_url} had unparsable Retry-After: {rle_inner.headers['Retry-After']}.", file=sys.stderr)
-                            
-                            if specific_retry_after is not None and specific_retry_after > 0:
-                                wait_seconds = specific_retry_after + 5 # Add a small buffer
-                                reset_time_for_log = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=wait_seconds)
-                                print(f"Waiting {wait_seconds:.0f}s based on specific Retry-After header from exception for {pr_url} (until ~{reset_time_for_log})...")
+            pending_pr_infos = pr_details_list # Grouping already left out PRs in the checkpoint
+
+            if pending_pr_infos:
+                # One GraphQL query per chunk of PRs replaces the per-PR get_repo/get_pull/comments calls.
+                # PRs saved locally by an interrupted earlier run need no API calls at all.
+                pr_numbers_to_fetch = [
+                    info['pr_number'] for info in pending_pr_infos
+                    if not is_pr_saved_locally(*get_pr_local_paths(pr_specific_output_dir, owner, repo_name, info['pr_number']))
+                ]
+                prefetched_comments_by_pr = fetch_review_comments_batch(session, owner, repo_name, pr_numbers_to_fetch) if pr_numbers_to_fetch else {}
+                pr_numbers_to_fetch = set(pr_numbers_to_fetch)
+
+                # PR fetches are network-bound, so run them concurrently on a bounded thread pool.
+                with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+                    for chunk_start in range(0, len(pending_pr_infos), RATE_LIMIT_PACING_CHUNK):
+                        pr_infos_chunk = pending_pr_infos[chunk_start:chunk_start + RATE_LIMIT_PACING_CHUNK]
+                        # Budget only what this chunk will call: locally saved PRs cost nothing, prefetched ones just the diff
+                        wait_for_rate_limit_budget(session, sum(
+                            1 if info['pr_number'] in prefetched_comments_by_pr else REST_CALLS_PER_PR
+                            for info in pr_infos_chunk if info['pr_number'] in pr_numbers_to_fetch
+                        ))
+                        saved_prs = executor.map(
+                            lambda info: fetch_and_save_pr(g, session, info, pr_specific_output_dir,
+                                                           prefetched_comments_by_pr.get(info['pr_number'])),
+                            pr_infos_chunk
+                        )
+                        for saved_pr in saved_prs:
+                            if saved_pr:
+                                repo_batch_successfully_fetched_and_saved.append(saved_pr)
                             else:
-                                # Fallback to general GitHub API rate limit reset time
-                                print(f"No specific Retry-After in RLE for {pr_url} or it was invalid. Using general GitHub API reset time.", file=sys.stderr)
-                                try:
-                                    rate_limit_info = g.get_rate_limit().core # core, search, graphql, etc.
-                                    reset_time = rate_limit_info.reset
-                                except Exception as e_rl:
-                                    print(f"Could not get primary rate limit info: {e_rl}. Waiting default 120s.", file=sys.stderr)
-                                    reset_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=120)
-                                wait_seconds = max((reset_time - datetime.datetime.now(datetime.timezone.utc)).total_seconds() + 15, 30) # Add buffer, min wait
-                            
-                            print(f"Overall rate limit policy for {pr_url}: Waiting for {wait_seconds:.0f} seconds...")
-                            time.sleep(wait_seconds)
-                            # Loop will continue to retry fetching this PR's data
-
-                        # Other GithubException or general exceptions from fetch_pr_data will be caught by the outer try-except for the PR
-                        # (the one that sets repo_batch_had_errors = True) if they are not handled within fetch_pr_data
-                        # and re-raised, or if they are part of the 'error_msg' handling above.
-
-                    # --- End of inner retry loop ---
-                    # If we exited the loop, it means fetch_pr_data was successful (no error_msg and no unhandled exception)
-                    
-                    # Save locally (ensure diff_text is not None if we got here)
-                    if diff_text is None: # Should not happen if loop logic is correct and fetch_pr_data succeeded
-                        print(f"Error: diff_text is None for {pr_url} after fetch attempts. Skipping save.", file=sys.stderr)
-                        raise Exception(f"diff_text was None for {pr_url} unexpectedly.")
-
-                    print(f"Saving diff locally to {local_diff_path}")
-                    with open(local_diff_path, 'w', encoding='utf-8') as f_diff:
-                        f_diff.write(diff_text)
-
-                    print(f"Saving comments locally to {local_comments_path}")
-                    if not save_comments_to_jsonl(comments_list, local_comments_path):
-                         raise Exception(f"Failed to save comments locally for {pr_url}")
-
-                    print(f"Successfully fetched and saved PR: {pr_url}")
-                    pr_processed_successfully_this_iteration = True
-                    repo_batch_successfully_fetched_and_saved.append({
-                        "owner": owner, "repo": repo_name, "pr_number": pr_number,
-                        "diff_path": local_diff_path, "comments_path": local_comments_path
-                    })
-
-                except ValueError as ve: # From parse_github_pr_url if it was somehow missed in grouping
-                    print(f"Skipping invalid URL: {pr_url} - {ve}", file=sys.stderr)
-                    repo_batch_had_errors = True
-                except GithubException as ge:
-                    print(f"GitHub API error processing PR {pr_url}: {ge}. Will not be added to current batch.", file=sys.stderr)
-                    repo_batch_had_errors = True
-                except Exception as pr_e:
-                    print(f"Error processing PR {pr_url}: {pr_e}. Will not be added to current batch.", file=sys.stderr)
-                    repo_batch_had_errors = True
-                
-                # Tally individual PR success/failure FOR THIS RUN
-                # This is different from overall_success_count which tracks PRs added to checkpoint.
-                # If pr_processed_successfully_this_iteration is false, it counts towards overall_failure_count for the run summary.
-                if not pr_processed_successfully_this_iteration and not is_pr_processed(owner, repo_name, pr_number, processed_prs_by_repo_checkpoint) :
-                     overall_failure_count +=1
+                                # Tally individual PR failures FOR THIS RUN for the run summary.
+                                # This is different from overall_success_count which tracks PRs added to checkpoint.
+                                repo_batch_had_errors = True
+                                overall_failure_count += 1
 
 
             # --- After processing all PRs for the current repository ---
             if repo_batch_successfully_fetched_and_saved:
-                batch_upload_successful_or_skipped = False
-                if args.skip_remote_upload:
-                    print(f"Skipping remote S3 upload for repository {owner}/{repo_name} as per --skip-remote-upload flag.")
-                    batch_upload_successful_or_skipped = True
-                else:
-                    print(f"Attempting to upload batch for repository {owner}/{repo_name} to S3.")
-                    # The path for rclone should be the parent directory containing all PR files for this repo
-                    repo_data_path_for_upload = local_output_path / owner / repo_name
-                    if upload_repository_batch_to_s3(config, repo_data_path_for_upload, owner, repo_name):
-                        print(f"Successfully uploaded batch for {owner}/{repo_name}.")
-                        batch_upload_successful_or_skipped = True
-                    else:
-                        print(f"Failed to upload batch for repository {owner}/{repo_name} to S3. These PRs will not be checkpointed in this run.", file=sys.stderr)
-                        repo_batch_had_errors = True # Mark that this repo batch had errors at upload stage
-                         # PRs that were locally saved but failed to upload contribute to failure_count
-                        overall_failure_count += len(repo_batch_successfully_fetched_and_saved)
-
+                awaiting_upload[repo_key] = repo_batch_successfully_fetched_and_saved
+            elif not repo_batch_had_errors:
+                 print(f"No new PRs processed for repository {owner}/{repo_name} in this run (all might have been skipped or input list for repo was empty).")
 
-                if batch_upload_successful_or_skipped:
-                    print(f"Updating checkpoint for repository {owner}/{repo_name}...")
-                    repo_key_for_checkpoint = f"{owner}/{repo_name}"
-                    if repo_key_for_checkpoint not in processed_prs_by_repo_checkpoint:
-                        processed_prs_by_repo_checkpoint[repo_key_for_checkpoint] = []
-                    
-                    newly_checkpointed_count_for_repo = 0
-                    for pr_data in repo_batch_successfully_fetched_and_saved:
-                        # Add to checkpoint only if not already there (though skip logic should prevent this)
-                        if pr_data["pr_number"] not in processed_prs_by_repo_checkpoint[repo_key_for_checkpoint]:
-                            processed_prs_by_repo_checkpoint[repo_key_for_checkpoint].append(pr_data["pr_number"])
-                            all_prs_fully_processed_in_this_run_or_before.add((owner, repo_name, pr_data["pr_number"]))
-                            overall_success_count += 1 # This PR is now fully processed and checkpointed.
-                            newly_checkpointed_count_for_repo +=1
-                    
-                    if newly_checkpointed_count_for_repo > 0:
-                         # Sort PR numbers for consistent checkpoint file
-                        processed_prs_by_repo_checkpoint[repo_key_for_checkpoint].sort()
-                        save_checkpoint(checkpoint_file_path, processed_prs_by_repo_checkpoint)
+            # Hand queued repositories to the uploader only once it is idle, so at most one upload
+            # is in flight and local data waiting on S3 stays bounded.
+            if uploader and awaiting_upload and (in_flight_upload is None or in_flight_upload[0].done()):
+                if in_flight_upload:
+                    upload_future, uploaded_prs_by_repo = in_flight_upload
+                    if upload_future.result():
+                        newly_checkpointed_prs = checkpoint_fetched_prs(checkpoint_file_path, processed_prs_by_repo_checkpoint, uploaded_prs_by_repo)
+                        all_prs_fully_processed_in_this_run_or_before.update(newly_checkpointed_prs)
+                        overall_success_count += len(newly_checkpointed_prs) # These PRs are now fully processed and checkpointed.
                     else:
-                        print(f"No new PRs to checkpoint for {owner}/{repo_name} in this batch.")
-                else: # Batch upload failed
-                    print(f"Skipping checkpoint update for {owner}/{repo_name} due to S3 upload failure or because all PRs in batch failed before upload stage.")
-            
-            elif not repo_batch_successfully_fetched_and_saved and not repo_batch_had_errors:
-                 print(f"No new PRs processed for repository {owner}/{repo_name} in this run (all might have been skipped or input list for repo was empty).")
+                        print(f"Failed to upload {len(uploaded_prs_by_repo)} repositories to S3. These PRs will not be checkpointed in this run.", file=sys.stderr)
+                        # PRs that were locally saved but failed to upload contribute to failure_count
+                        overall_failure_count += sum(len(prs) for prs in uploaded_prs_by_repo.values())
+                print(f"\nStarting background upload of {len(awaiting_upload)} repositories to S3.")
+                in_flight_upload = (uploader.submit(upload_repositories_to_s3, config, local_output_path, awaiting_upload), awaiting_upload)
+                awaiting_upload = {}
+
+        # --- Wait for the remaining uploads, then checkpoint them ---
+        if args.skip_remote_upload:
+            if awaiting_upload:
+                print(f"Skipping remote S3 upload for {len(awaiting_upload)} repositories as per --skip-remote-upload flag.")
+                newly_checkpointed_prs = checkpoint_fetched_prs(checkpoint_file_path, processed_prs_by_repo_checkpoint, awaiting_upload)
+                all_prs_fully_processed_in_this_run_or_before.update(newly_checkpointed_prs)
+                overall_success_count += len(newly_checkpointed_prs)
+        else:
+            while in_flight_upload:
+                upload_future, uploaded_prs_by_repo = in_flight_upload
+                if upload_future.result():
+                    newly_checkpointed_prs = checkpoint_fetched_prs(checkpoint_file_path, processed_prs_by_repo_checkpoint, uploaded_prs_by_repo)
+                    all_prs_fully_processed_in_this_run_or_before.update(newly_checkpointed_prs)
+                    overall_success_count += len(newly_checkpointed_prs)
+                else:
+                    print(f"Failed to upload {len(uploaded_prs_by_repo)} repositories to S3. These PRs will not be checkpointed in this run.", file=sys.stderr)
+                    overall_failure_count += sum(len(prs) for prs in uploaded_prs_by_repo.values())
+                in_flight_upload = None
+                if awaiting_upload:
+                    print(f"\nStarting upload of the remaining {len(awaiting_upload)} repositories to S3.")
+                    in_flight_upload = (uploader.submit(upload_repositories_to_s3, config, local_output_path, awaiting_upload), awaiting_upload)
+                    awaiting_upload = {}
+            uploader.shutdown()
 
 
         # --- Final Checkpoint Cleanup ---
-        all_input_prs_parsed_details = []
-        for url in all_input_pr_urls:
-            try:
-                owner_in, repo_in, pr_num_in = parse_github_pr_url(url)
-                all_input_prs_parsed_details.append((owner_in, repo_in, pr_num_in))
-            except ValueError:
-                pass # Already logged during grouping
+        # all_input_prs_parsed_details holds every valid input PR, parsed once during grouping
 
         # Check if every PR in the original input list is now considered processed
         # (either from this run or a previous one via checkpoint)
@@ -681,47 +1040,40 @@ if __name__ == "__main__":
         # Corrected logic for checkpoint deletion:
         # Only delete if there were NO failures in *this current run* AND all PRs from input list are in the checkpoint
         
-        num_total_input_prs = len(all_input_prs_parsed_details)
-        num_successfully_processed_ever = len(all_prs_fully_processed_in_this_run_or_before)
+        # Input PRs not yet in the checkpoint, in one set difference. After a failed run the checkpoint
+        # is kept regardless, so the difference isn't computed at all.
+        missing_input_prs = None if overall_failure_count > 0 else set(all_input_prs_parsed_details) - all_prs_fully_processed_in_this_run_or_before
+        can_delete_checkpoint = overall_failure_count == 0 and not missing_input_prs
 
-        can_delete_checkpoint = True
-        if overall_failure_count > 0: # If any PR failed in *this specific run*
+        if can_delete_checkpoint:
+            print(f"All {len(all_input_prs_parsed_details)} PRs from input list are processed and no failures in this run. Deleting checkpoint file.")
+            try:
+                checkpoint_file_path.unlink(missing_ok=True)
+            except Exception as e:
+                print(f"Error deleting checkpoint file {checkpoint_file_path}: {e}", file=sys.stderr)
+        elif overall_failure_count > 0: # If any PR failed in *this specific run*
             print(f"Checkpoint file {checkpoint_file_path} will be kept due to {overall_failure_count} failures in this run.")
-            can_delete_checkpoint = False
-        else: # No failures in this run, now check if all input PRs are in the checkpoint
-            if num_successfully_processed_ever >= num_total_input_prs:
-                # Double check: every single PR from input must be in the 'all_prs_fully_processed_in_this_run_or_before' set
-                all_required_prs_are_processed = True
-                for req_owner, req_repo, req_pr_num in all_input_prs_parsed_details:
-                    if (req_owner, req_repo, req_pr_num) not in all_prs_fully_processed_in_this_run_or_before:
-                        all_required_prs_are_processed = False
-                        print(f"Debug: Required PR {req_owner}/{req_repo}#{req_pr_num} not found in fully processed set for checkpoint deletion.")
-                        break
-                
-                if all_required_prs_are_processed:
-                    print(f"All {num_total_input_prs} PRs from input list are processed and no failures in this run. Deleting checkpoint file.")
-                    try:
-                        checkpoint_file_path.unlink(missing_ok=True)
-                    except Exception as e:
-                        print(f"Error deleting checkpoint file {checkpoint_file_path}: {e}", file=sys.stderr)
-                else:
-                    print(f"Checkpoint file {checkpoint_file_path} will be kept as not all PRs from the input list are fully processed yet (processed: {num_successfully_processed_ever}/{num_total_input_prs}).")
-                    can_delete_checkpoint = False
-            else:
-                print(f"Checkpoint file {checkpoint_file_path} will be kept. Not all PRs from input list are processed (processed: {num_successfully_processed_ever}/{num_total_input_prs}).")
-                can_delete_checkpoint = False
+        else:
+            req_owner, req_repo, req_pr_num = next(iter(missing_input_prs))
+            print(f"Debug: Required PR {req_owner}/{req_repo}#{req_pr_num} not found in fully processed set for checkpoint deletion.")
+            print(f"Checkpoint file {checkpoint_file_path} will be kept as not all PRs from the input list are fully processed yet ({len(missing_input_prs)} missing, processed: {len(all_prs_fully_processed_in_this_run_or_before)}/{len(all_input_prs_parsed_details)}).")
 
 
         # --- Summary ---
-        print("="*40)
-        print("Processing Summary:")
-        print(f"  Total PRs listed in input file: {len(all_input_pr_urls)}")
-        print(f"  Number of unique repositories processed: {len(prs_grouped_by_repository)}")
-        # overall_success_count is PRs NEWLY checkpointed in THIS RUN
-        print(f"  Successfully processed & checkpointed in this run: {overall_success_count}")
-        print(f"  Failed in this run (fetch, save, or upload): {overall_failure_count}")
-        print(f"  Total PRs in checkpoint (including previous runs): {sum(len(prs) for prs in processed_prs_by_repo_checkpoint.values())}")
-        print("="*40)
+        # Built as one block and written with a single print
+        summary_lines = [
+            "="*40,
+            "Processing Summary:",
+            f"  Total PRs listed in input file: {len(all_input_pr_urls)}",
+            f"  Number of unique repositories processed: {len(prs_grouped_by_repository)}",
+            # overall_success_count is PRs NEWLY checkpointed in THIS RUN
+            f"  Successfully processed & checkpointed in this run: {overall_success_count}",
+            f"  Failed in this run (fetch, save, or upload): {overall_failure_count}",
+            # The flat processed set mirrors the checkpoint, so its size is the checkpoint total without walking every repository
+            f"  Total PRs in checkpoint (including previous runs): {len(all_prs_fully_processed_in_this_run_or_before)}",
+            "="*40,
+        ]
+        print("\n".join(summary_lines))
 
         if overall_failure_count > 0:
             if overall_success_count > 0: # Some succeeded in this run, some failed
@@ -733,11 +1085,7 @@ if __name__ == "__main__":
                 print("Halting pipeline as the fetching stage produced no usable new data.")
                 sys.exit(1) # Signal failure to the orchestrator
         else: # overall_failure_count == 0 (no errors in this specific run)
-            all_input_covered_by_checkpoint = True
-            for req_owner, req_repo, req_pr_num in all_input_prs_parsed_details:
-                if not is_pr_processed(req_owner, req_repo, req_pr_num, processed_prs_by_repo_checkpoint):
-                    all_input_covered_by_checkpoint = False
-                    break
+            all_input_covered_by_checkpoint = not missing_input_prs
             if all_input_covered_by_checkpoint:
                  print("Completed successfully. All input PRs are accounted for in the checkpoint.")
                  sys.exit(0)
@@ -749,3 +1097,7 @@ if __name__ == "__main__":
         print("Error: Either --pr-identifier or --input-pr-list must be provided.", file=sys.stderr)
         parser.print_help()
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
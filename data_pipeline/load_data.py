@@ -2,8 +2,10 @@ import os
 import sys
 import subprocess
 import yaml
+from yaml_loader import YamlSafeLoader
 import argparse
 import time
+from collections import deque
 from pathlib import Path
 
 # Helper functions (copied/adapted from existing scripts)
@@ -11,7 +13,7 @@ def load_config(config_path):
     """Loads the YAML configuration file."""
     try:
         with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=YamlSafeLoader)
         # Validation for this script
         if not config:
             raise ValueError("Config file is empty.")
@@ -30,15 +32,25 @@ def load_config(config_path):
         print(f"Error in config file structure: {e}", file=sys.stderr)
         sys.exit(1)
 
-def run_rclone_command(args, suppress_output=False, max_retries=3, retry_delay=5):
-    """Runs an rclone command with retry logic."""
+def run_rclone_command(args, suppress_output=False, max_retries=3, retry_delay=5, error_tail_lines=50):
+    """
+    Runs an rclone command with retry logic.
+    Output (stderr merged into stdout) is streamed line by line while rclone runs; only the
+    last error_tail_lines lines are kept for the returned message.
+    """
     command = ['rclone'] + args
     print(f"Running command: {' '.join(command)}")
 
     for attempt in range(max_retries):
         try:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            stdout, stderr = process.communicate()
+            output_tail = deque(maxlen=error_tail_lines)
+            with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1) as process:
+                for line in process.stdout:
+                    output_tail.append(line)
+                    if not suppress_output:
+                        sys.stdout.write(line)
+                process.wait()
+            output = ''.join(output_tail)
             if process.returncode != 0:
                  if attempt < max_retries - 1:
                      print(f"Attempt {attempt + 1}/{max_retries} failed. Retrying in {retry_delay} seconds...")
@@ -46,15 +58,10 @@ def run_rclone_command(args, suppress_output=False, max_retries=3, retry_delay=5
                      continue
                  print(f"Error running rclone command: {' '.join(command)}", file=sys.stderr)
                  print(f"Return Code: {process.returncode}", file=sys.stderr)
-                 print(f"Stderr: {stderr}", file=sys.stderr)
-                 return False, stderr
+                 print(f"Last rclone output:\n{output}", file=sys.stderr)
+                 return False, output
             else:
-                if not suppress_output and stdout:
-                    print(f"Rclone stdout: {stdout}")
-                # Rclone often outputs progress/stats to stderr, print it unless suppressed
-                if stderr and not suppress_output:
-                    print(f"Rclone stderr: {stderr}")
-                return True, stderr # Return stderr even on success for potential info
+                return True, output # Return the output tail even on success for potential info
         except FileNotFoundError:
              print("Error: 'rclone' command not found.", file=sys.stderr)
              return False, "rclone not found"
@@ -102,8 +109,16 @@ if __name__ == "__main__":
         'copy', # or 'sync'
         str(input_dir),      # Source directory
         remote_dest_path,    # Destination path
-        '--progress',        # Show progress during transfer
-        # Add other rclone flags if needed (e.g., --checksum, --transfers, --checkers)
+        # Compact one-line transfer stats every 10s; --progress redraws constantly, which is noise once piped
+        '--stats=10s',
+        '--stats-one-line',
+        '--stats-log-level', 'NOTICE',
+        # Many small aligned JSONL files: run far more parallel PUTs/checks than rclone's default 4/8,
+        # and list the destination with as few (recursive) LIST calls as possible.
+        '--transfers=32',
+        '--checkers=64',
+        '--fast-list',
+        '--s3-no-check-bucket', # Skip the bucket existence HEAD/create on every run
     ]
     if args.debug:
          rclone_args.append('-vv') # Add verbose logging for debug mode
@@ -1,12 +1,24 @@
 import os
+import re
 import sys
+import importlib
 import subprocess
 import yaml
+from yaml_loader import YamlSafeLoader
 import argparse
 from pathlib import Path
 import shutil
 import tempfile
 import time # Added for rclone retry delay
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# Characters not allowed in a PR's intermediate directory/file name (same set as str.isalnum() plus '_' and '-')
+PR_SLUG_UNSAFE_PATTERN = re.compile(r'[^\w-]')
+# PRs processed concurrently with --pr-identifiers-file. Fixed rather than os.cpu_count(): the work is mostly
+# GitHub requests, and every worker process adds to the same token's concurrent request count
+DEFAULT_PARALLELISM = 4
 
 # --- Helper Functions (duplicated from run_pipeline.py for now) ---
 
@@ -14,7 +26,7 @@ def load_config(config_path):
     """Loads the YAML configuration file."""
     try:
         with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=YamlSafeLoader)
         if not config:
             raise ValueError("Config file is empty.")
         # Validation for online evaluation mode
@@ -37,32 +49,38 @@ def load_config(config_path):
         print(f"Error in config file structure: {e}", file=sys.stderr)
         sys.exit(1)
 
-def run_rclone_command(args_list, suppress_output=False, max_retries=3, retry_delay=5):
-    """Runs an rclone command with retry logic. Args_list is the list of arguments for rclone."""
+def run_rclone_command(args_list, suppress_output=False, max_retries=3, retry_delay=5, error_tail_lines=100):
+    """
+    Runs an rclone command with retry logic. Args_list is the list of arguments for rclone.
+    rclone's stderr (where it logs progress and errors) is streamed line by line as it runs;
+    only the last error_tail_lines lines are kept for the returned message.
+    """
     command = ['rclone'] + args_list
     print(f"Running rclone command: {' '.join(command)}")
 
     for attempt in range(max_retries):
         try:
-            # Using subprocess.run for potentially simpler capture and error checking
-            process = subprocess.run(command, capture_output=True, text=True, check=False) 
+            stderr_tail = deque(maxlen=error_tail_lines)
+            with subprocess.Popen(command, stdout=subprocess.DEVNULL if suppress_output else None,
+                                  stderr=subprocess.PIPE, text=True, bufsize=1) as process:
+                for line in process.stderr:
+                    stderr_tail.append(line)
+                    if not suppress_output: # Rclone often uses stderr for progress
+                        sys.stderr.write(line)
+                process.wait()
+            stderr_output = ''.join(stderr_tail)
             if process.returncode != 0:
                  if attempt < max_retries - 1:
                      print(f"Rclone attempt {attempt + 1}/{max_retries} failed. Retrying in {retry_delay} seconds...", file=sys.stderr)
-                     print(f"Rclone stderr: {process.stderr}", file=sys.stderr)
+                     print(f"Rclone stderr: {stderr_output}", file=sys.stderr)
                      time.sleep(retry_delay)
                      continue
                  print(f"Error running rclone command: {' '.join(command)}", file=sys.stderr)
                  print(f"Return Code: {process.returncode}", file=sys.stderr)
-                 print(f"Rclone stdout: {process.stdout}", file=sys.stderr) # stdout might also have info
-                 print(f"Rclone stderr: {process.stderr}", file=sys.stderr)
-                 return False, process.stderr
+                 print(f"Rclone stderr: {stderr_output}", file=sys.stderr)
+                 return False, stderr_output
             else:
-                if not suppress_output and process.stdout:
-                    print(f"Rclone stdout: {process.stdout}")
-                if process.stderr and not suppress_output: # Rclone often uses stderr for progress
-                    print(f"Rclone stderr: {process.stderr}")
-                return True, process.stderr # Return stderr even on success for potential info
+                return True, stderr_output # Return stderr even on success for potential info
         except FileNotFoundError:
              print("Error: 'rclone' command not found. Ensure it is installed and in PATH.", file=sys.stderr)
              return False, "rclone not found"
@@ -93,23 +111,100 @@ def run_script(script_name, args_list, working_dir=None):
         print(f"Failed to execute {script_name}: {e}", file=sys.stderr)
         return False
 
-# --- Main Online Evaluation Orchestration ---
+def run_script_inproc(script_name, args_list):
+    """
+    Runs a pipeline script in this interpreter by importing it and calling its main(argv),
+    avoiding a fresh Python start-up and re-import of its dependencies for every step.
+    The scripts exit via sys.exit, so SystemExit is caught and its code checked like a return code.
+    """
+    module_name = Path(script_name).stem
+    print("-"*20 + f" Running {script_name} (in-process) " + "-"*20)
+    print(f"Arguments: {' '.join(args_list)}")
+    try:
+        module = importlib.import_module(module_name)
+        module.main(args_list)
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception as e:
+        print(f"Failed to execute {script_name}: {e}", file=sys.stderr)
+        return False
+    if exit_code != 0:
+        print(f"Error: {script_name} failed with exit code {exit_code}", file=sys.stderr)
+        return False
+    print(f"{script_name} completed successfully.")
+    return True
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Orchestrate online evaluation for a single GitHub PR.")
-    parser.add_argument("--config", default="config.yaml", help="Path to the YAML configuration file.")
-    parser.add_argument("--pr-identifier", required=True, help="Identifier for the PR to process (e.g., 'owner/repo/pr_number' or a direct URL that github_pr_fetcher.py can handle).")
-    parser.add_argument("--intermediate-dir", default="./pipeline_intermediate_online", help="Base directory for temporary intermediate files for online processing.")
-    parser.add_argument("--debug", action="store_true", help="Enable debug flags for sub-scripts and keep intermediate files.")
+STAGED_UPLOADS_DIRNAME = "staged_uploads"
+STAGED_UPLOADS_MANIFEST = "manifest.txt"
 
-    args = parser.parse_args()
+def stage_for_batch_upload(output_file, staging_dir):
+    """
+    Moves a finished output file into staging_dir and records it in the staging manifest,
+    so many PRs can be sent later by a single rclone run (see flush_staged_uploads).
+    """
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    os.replace(output_file, staging_dir / output_file.name) # Same filesystem (both under --intermediate-dir)
+    # One short O_APPEND write per file, so parallel PR workers can append without a lock
+    with open(staging_dir / STAGED_UPLOADS_MANIFEST, 'a') as f:
+        f.write(output_file.name + '\n')
+
+def s3_remote_target(config):
+    """Returns the validated 'remote:bucket/path/' upload target from config, with a trailing slash."""
+    s3_target_base_path_str = config['online_evaluation']['s3_target_path']
+    if not s3_target_base_path_str.endswith('/'):
+        s3_target_base_path_str += '/'
+    return f"{config['rclone_remote_name']}:{s3_target_base_path_str}"
+
+def flush_staged_uploads(remote_target, staging_dir, suppress_output=True):
+    """
+    Uploads every file listed in the staging manifest with one `rclone copy --files-from` run,
+    paying rclone start-up and S3 connection setup once for the whole batch.
+    The manifest is first renamed to a flush-private file, so --batch-uploads runs staging meanwhile
+    start a fresh manifest instead of appending to (and losing lines from) the one being uploaded.
+    Only the files listed in the taken manifest are removed, and only after a successful upload;
+    on failure its lines go back into the live manifest for the next flush. Returns True on success.
+    """
+    manifest_path = staging_dir / STAGED_UPLOADS_MANIFEST
+    flushing_manifest_path = staging_dir / f"{manifest_path.stem}.{os.getpid()}.flushing"
+    try:
+        os.replace(manifest_path, flushing_manifest_path)
+    except FileNotFoundError:
+        print(f"No staged uploads found in {staging_dir}.")
+        return True
+    with open(flushing_manifest_path, 'r') as f:
+        staged_names = list(dict.fromkeys(line for line in map(str.strip, f) if line))
+
+    print(f"Uploading {len(staged_names)} staged files from {staging_dir} to {remote_target}...")
+    upload_success, rclone_output = run_rclone_command(
+        ['copy', str(staging_dir), remote_target, '--files-from', str(flushing_manifest_path),
+         '--transfers=16', '--checkers=16', '--no-traverse', '--s3-no-check-bucket'],
+        suppress_output=suppress_output
+    )
+    if not upload_success:
+        with open(manifest_path, 'a') as f:
+            f.writelines(name + '\n' for name in staged_names)
+        flushing_manifest_path.unlink()
+        print(f"Failed to upload staged files to S3. They are kept in {staging_dir} for the next flush. Rclone output: {rclone_output}", file=sys.stderr)
+        return False
+    for name in staged_names:
+        (staging_dir / name).unlink(missing_ok=True)
+    flushing_manifest_path.unlink()
+    print(f"Successfully uploaded {len(staged_names)} staged files to {remote_target}")
+    return True
+
+def process_pr(pr_identifier, args, remote_target):
+    """
+    Runs fetch -> extract hunks -> upload (or stage) for one PR in its own intermediate directory.
+    remote_target comes from s3_remote_target, resolved once per run rather than per PR.
+    Returns True on success, False if any step failed. Module-level so process pool workers can run it.
+    """
+    run_step = run_script if args.subprocess else run_script_inproc
+    staging_dir = Path(args.intermediate_dir) / STAGED_UPLOADS_DIRNAME
 
-    # --- Setup ---
-    config = load_config(args.config)
-    
     # Create a unique temporary directory for this specific PR run
     # Sanitize pr_identifier to make it a valid directory name component
-    pr_identifier_slug = "".join(c if c.isalnum() or c in ('_','-') else '_' for c in args.pr_identifier)
+    pr_identifier_slug = PR_SLUG_UNSAFE_PATTERN.sub('_', pr_identifier)
     run_specific_intermediate_dir = Path(args.intermediate_dir) / pr_identifier_slug
     
     try:
@@ -122,85 +217,88 @@ if __name__ == "__main__":
         transformed_data_dir = run_specific_intermediate_dir / "transformed_data"
         transformed_data_dir.mkdir(parents=True, exist_ok=True)
 
-        # Handoff path config now points to S3, not a local dir for staging
-        s3_target_base_path_str = config['online_evaluation']['s3_target_path']
-        rclone_remote_name = config['rclone_remote_name']
-        if not s3_target_base_path_str.endswith('/'):
-            s3_target_base_path_str += '/'
-
-
         # --- Step 1: Fetch Raw Data for the Single PR ---
-        print("\n" + "="*10 + " STEP 1: Fetch Raw Data for PR " + args.pr_identifier + "="*10)
+        print("\n" + "="*10 + " STEP 1: Fetch Raw Data for PR " + pr_identifier + "="*10)
         fetcher_args = [
             "--config", args.config,
             # Assuming github_pr_fetcher.py will be modified to accept --pr-identifier
             # and use it directly, bypassing --input-pr-list for single PR mode.
-            "--pr-identifier", args.pr_identifier, # This argument needs to be added to github_pr_fetcher.py
+            "--pr-identifier", pr_identifier, # This argument needs to be added to github_pr_fetcher.py
             "--local-output-dir", str(raw_data_dir),
             "--skip-remote-upload" # Always skip S3 for online mode's raw data
         ]
         if args.debug:
             fetcher_args.append("--debug")
 
-        fetch_success = run_script("github_pr_fetcher.py", fetcher_args)
+        fetch_success = run_step("github_pr_fetcher.py", fetcher_args)
         if not fetch_success:
-            print(f"Failed to fetch data for PR {args.pr_identifier}. Exiting.")
-            sys.exit(1)
+            print(f"Failed to fetch data for PR {pr_identifier}. Exiting.")
+            return False
         
         # Locate the fetched .diff file. 
         # This assumes github_pr_fetcher.py (when modified) will save the diff file with a predictable name
         # based on pr_identifier or a known pattern within raw_data_dir for a single PR.
         # For now, let's assume it could be named pr_identifier_slug.diff or the first .diff file found.
         # This part might need refinement once github_pr_fetcher.py single PR mode is finalized.
-        input_diff_file = None
-        diff_files_found = list(raw_data_dir.glob("*.diff"))
-        if not diff_files_found:
-            print(f"Error: No .diff file found in {raw_data_dir} after fetch step for PR {args.pr_identifier}. Exiting.", file=sys.stderr)
-            sys.exit(1)
-        if len(diff_files_found) > 1:
-            print(f"Warning: Multiple .diff files found in {raw_data_dir}. Using the first one: {diff_files_found[0]}", file=sys.stderr)
-        input_diff_file = diff_files_found[0]
+        # Single pass over the directory: stop after the first .diff, plus one more to detect duplicates
+        diff_files_iter = (p for p in raw_data_dir.iterdir() if p.suffix == '.diff')
+        input_diff_file = next(diff_files_iter, None)
+        if input_diff_file is None:
+            print(f"Error: No .diff file found in {raw_data_dir} after fetch step for PR {pr_identifier}. Exiting.", file=sys.stderr)
+            return False
+        if next(diff_files_iter, None) is not None:
+            print(f"Warning: Multiple .diff files found in {raw_data_dir}. Using the first one: {input_diff_file}", file=sys.stderr)
         print(f"Using diff file for transformation: {input_diff_file}")
 
         # --- Step 2: Extract Diff Hunks (Replaces Transform and Align Data) ---
-        print("\n" + "="*10 + " STEP 2: Extract Diff Hunks for PR " + args.pr_identifier + "="*10)
+        print("\n" + "="*10 + " STEP 2: Extract Diff Hunks for PR " + pr_identifier + "="*10)
         output_hunks_jsonl = transformed_data_dir / f"{pr_identifier_slug}_hunks.jsonl"
         
         hunk_extractor_args = [
             "--input-pr-diff-file", str(input_diff_file),
             "--output-jsonl-file", str(output_hunks_jsonl),
-            "--pr-identifier", args.pr_identifier,
+            "--pr-identifier", pr_identifier,
             "--config", args.config, # For consistency, though extract_diff_hunks.py doesn't use it
         ]
         # extract_diff_hunks.py doesn't have a --debug flag in its args, but run_script can pass it if it did.
 
-        transform_success = run_script("extract_diff_hunks.py", hunk_extractor_args)
+        transform_success = run_step("extract_diff_hunks.py", hunk_extractor_args)
         if not transform_success:
-            print(f"Failed to extract hunks for PR {args.pr_identifier}. Exiting.")
-            sys.exit(1)
+            print(f"Failed to extract hunks for PR {pr_identifier}. Exiting.")
+            return False
 
         # --- Step 3: Upload Transformed Data to S3 ---
-        print("\n" + "="*10 + " STEP 3: Upload Transformed Data to S3 for PR " + args.pr_identifier + "="*10)
+        print("\n" + "="*10 + " STEP 3: Upload Transformed Data to S3 for PR " + pr_identifier + "="*10)
         
         if not output_hunks_jsonl.exists() or not output_hunks_jsonl.is_file():
             print(f"Error: Expected output file {output_hunks_jsonl} not found after hunk extraction. Cannot upload.", file=sys.stderr)
-            sys.exit(1)
+            return False
 
-        # Construct the full remote S3 path for the specific file
-        # Example: remote:bucket/online_eval_hunks/pr_owner_repo_123_hunks.jsonl
-        remote_s3_file_path = f"{rclone_remote_name}:{s3_target_base_path_str}{output_hunks_jsonl.name}"
-        
-        print(f"Attempting to upload '{output_hunks_jsonl}' to '{remote_s3_file_path}'...")
-        upload_success, rclone_output = run_rclone_command(
-            ['copyto', str(output_hunks_jsonl), remote_s3_file_path],
-            suppress_output=not args.debug # Show rclone output if in debug mode
-        )
-
-        if upload_success:
-            print(f"Successfully uploaded transformed hunks to {remote_s3_file_path}")
+        if args.batch_uploads:
+            # Outside the run-specific dir, so cleanup below leaves it for the next --flush-uploads
+            stage_for_batch_upload(output_hunks_jsonl, staging_dir)
+            print(f"Staged {output_hunks_jsonl.name} in {staging_dir} for the next --flush-uploads run.")
         else:
-            print(f"Failed to upload transformed hunks to S3 for PR {args.pr_identifier}. Rclone output: {rclone_output}", file=sys.stderr)
-            sys.exit(1)
+            # Construct the full remote S3 path for the specific file
+            # Example: remote:bucket/online_eval_hunks/pr_owner_repo_123_hunks.jsonl
+            remote_s3_file_path = f"{remote_target}{output_hunks_jsonl.name}"
+
+            print(f"Attempting to upload '{output_hunks_jsonl}' to '{remote_s3_file_path}'...")
+            upload_success, rclone_output = run_rclone_command(
+                ['copyto', str(output_hunks_jsonl), remote_s3_file_path],
+                suppress_output=not args.debug # Show rclone output if in debug mode
+            )
+
+            if upload_success:
+                print(f"Successfully uploaded transformed hunks to {remote_s3_file_path}")
+            else:
+                print(f"Failed to upload transformed hunks to S3 for PR {pr_identifier}. Rclone output: {rclone_output}", file=sys.stderr)
+                return False
+
+    except Exception as e:
+        # Contain the failure to this PR so the rest of a batch (and the pool's map) keeps going
+        print(f"Error processing PR {pr_identifier}: {type(e).__name__} - {e}", file=sys.stderr)
+        return False
 
     finally:
         # --- Cleanup ---
@@ -214,5 +312,55 @@ if __name__ == "__main__":
         elif args.debug:
             print(f"Debug mode: Intermediate files kept at {run_specific_intermediate_dir}")
 
-    print("\nOnline evaluation pipeline for PR", args.pr_identifier, "completed.")
-    sys.exit(0) 
\ No newline at end of file
+    print("\nOnline evaluation pipeline for PR", pr_identifier, "completed.")
+    return True
+
+
+# --- Main Online Evaluation Orchestration ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Orchestrate online evaluation for one or more GitHub PRs.")
+    parser.add_argument("--config", default="config.yaml", help="Path to the YAML configuration file.")
+    parser.add_argument("--pr-identifier", help="Identifier for the PR to process (e.g., 'owner/repo/pr_number' or a direct URL that github_pr_fetcher.py can handle).")
+    parser.add_argument("--intermediate-dir", default="./pipeline_intermediate_online", help="Base directory for temporary intermediate files for online processing.")
+    parser.add_argument("--debug", action="store_true", help="Enable debug flags for sub-scripts and keep intermediate files.")
+    parser.add_argument("--subprocess", action="store_true", help="Run each step as a separate Python process instead of in-process, for isolation.")
+    parser.add_argument("--batch-uploads", action="store_true", help="Stage the output under --intermediate-dir instead of uploading it now; send staged files later with --flush-uploads.")
+    parser.add_argument("--pr-identifiers-file", help="Text file with one PR identifier per line; processes every listed PR instead of --pr-identifier.")
+    parser.add_argument("--parallelism", type=int, default=DEFAULT_PARALLELISM,
+                        help=f"Number of PRs processed concurrently with --pr-identifiers-file (default {DEFAULT_PARALLELISM}). "
+                             "Each PR is fetched in single-PR mode, which issues its GitHub requests one at a time "
+                             "(--max-workers only applies to the fetcher's batch mode), so at most this many GitHub "
+                             "requests are in flight at once.")
+    parser.add_argument("--flush-uploads", action="store_true", help="Upload all files staged by --batch-uploads runs in one rclone call, then exit.")
+
+    args = parser.parse_args()
+    if not args.pr_identifier and not args.pr_identifiers_file and not args.flush_uploads:
+        parser.error("--pr-identifier or --pr-identifiers-file is required unless --flush-uploads is given.")
+
+    # --- Setup ---
+    config = load_config(args.config)
+    # Upload target is resolved once here and handed to every PR instead of re-deriving it per PR
+    remote_target = s3_remote_target(config)
+
+    if args.flush_uploads:
+        staging_dir = Path(args.intermediate_dir) / STAGED_UPLOADS_DIRNAME
+        sys.exit(0 if flush_staged_uploads(remote_target, staging_dir, suppress_output=not args.debug) else 1)
+
+    if args.pr_identifiers_file:
+        with open(args.pr_identifiers_file, 'r') as f:
+            pr_identifiers = list(dict.fromkeys(line for line in map(str.strip, f) if line))
+    else:
+        pr_identifiers = [args.pr_identifier]
+
+    if len(pr_identifiers) > 1 and args.parallelism > 1:
+        # Each PR runs in its own process so one PR's network waits overlap another's hunk extraction
+        with ProcessPoolExecutor(max_workers=args.parallelism) as executor:
+            results = list(executor.map(partial(process_pr, args=args, remote_target=remote_target), pr_identifiers))
+    else:
+        results = [process_pr(pr_identifier, args, remote_target) for pr_identifier in pr_identifiers]
+
+    failed_count = results.count(False)
+    if len(pr_identifiers) > 1:
+        print(f"\nProcessed {len(pr_identifiers)} PRs: {len(pr_identifiers) - failed_count} succeeded, {failed_count} failed.")
+    sys.exit(1 if failed_count else 0)
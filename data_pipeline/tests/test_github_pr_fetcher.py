@@ -0,0 +1,182 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import github_pr_fetcher
+
+
+class InterruptedResponse:
+    """Streams one chunk of the body, then fails like a dropped connection."""
+
+    def iter_content(self, chunk_size=1):
+        yield b"diff --git a/x.py b/x.py\n"
+        raise ConnectionError("connection dropped")
+
+
+def test_empty_diff_with_comments_counts_as_saved(tmp_path):
+    diff_path, comments_path = github_pr_fetcher.get_pr_local_paths(tmp_path, "o", "r", 1)
+    diff_path.write_bytes(b"")
+    assert not github_pr_fetcher.is_pr_saved_locally(diff_path, comments_path)
+    assert github_pr_fetcher.save_comments_to_jsonl([], comments_path)
+    assert github_pr_fetcher.is_pr_saved_locally(diff_path, comments_path)
+
+
+def test_interrupted_diff_download_leaves_no_file(tmp_path):
+    diff_path, _ = github_pr_fetcher.get_pr_local_paths(tmp_path, "o", "r", 1)
+    with pytest.raises(ConnectionError):
+        github_pr_fetcher.stream_response_to_file(InterruptedResponse(), diff_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_comments_save_leaves_no_file(tmp_path):
+    _, comments_path = github_pr_fetcher.get_pr_local_paths(tmp_path, "o", "r", 1)
+    assert not github_pr_fetcher.save_comments_to_jsonl([{"body": object()}], comments_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+class FailingRateLimitSession:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        raise requests.exceptions.ConnectionError("rate limit endpoint down")
+
+
+def test_failed_rate_limit_poll_falls_back_to_tracked_budget(monkeypatch):
+    monkeypatch.setattr(github_pr_fetcher, "rest_rate_limit_state",
+                        {"remaining": 3, "limit": 5000, "reset": time.time() + 100, "polled_at": 0.0})
+    sleeps = []
+    monkeypatch.setattr(github_pr_fetcher.time, "sleep", sleeps.append)
+
+    github_pr_fetcher.wait_for_rate_limit_budget(FailingRateLimitSession(), 10)
+    assert len(sleeps) == 1 # Paced on the 3 calls left seen in response headers
+
+
+def test_failed_rate_limit_poll_is_not_retried_immediately(monkeypatch):
+    monkeypatch.setattr(github_pr_fetcher, "rest_rate_limit_state",
+                        {"remaining": None, "limit": None, "reset": 0.0, "polled_at": 0.0})
+    session = FailingRateLimitSession()
+
+    github_pr_fetcher.wait_for_rate_limit_budget(session, 10)
+    github_pr_fetcher.wait_for_rate_limit_budget(session, 10)
+    assert session.calls == 1 # Within RATE_LIMIT_POLL_INTERVAL of the failed poll
+
+
+CONFIG_YAML = """data_paths:
+  raw: raw/
+  remote_raw_data_base: bucket/raw/
+rclone_remote_name: remote
+"""
+
+
+def run_batch_main(tmp_path, monkeypatch, pr_urls):
+    """Runs github_pr_fetcher.main in batch mode against a fake GitHub client; returns the exit code."""
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(CONFIG_YAML)
+    pr_list_path = tmp_path / "prs.txt"
+    pr_list_path.write_text("".join(url + "\n" for url in pr_urls))
+    monkeypatch.setenv("GITHUB_TOKEN", "test-token")
+    monkeypatch.setattr(github_pr_fetcher, "Github",
+                        lambda **kwargs: SimpleNamespace(get_user=lambda: SimpleNamespace(login="tester")))
+    with pytest.raises(SystemExit) as exit_info:
+        github_pr_fetcher.main(["--config", str(config_path), "--input-pr-list", str(pr_list_path),
+                                "--local-output-dir", str(tmp_path / "out"), "--skip-remote-upload"])
+    return exit_info.value.code
+
+
+def test_input_without_valid_pr_urls_keeps_checkpoint(tmp_path, monkeypatch):
+    checkpoint_path = tmp_path / "out" / github_pr_fetcher.CHECKPOINT_FILENAME
+    checkpoint_path.parent.mkdir()
+    checkpoint_path.write_text('{"r": "o/r", "n": 1}\n')
+
+    assert run_batch_main(tmp_path, monkeypatch, ["not a url", "https://example.com/o/r/pull/2"]) == 0
+    assert checkpoint_path.read_text() == '{"r": "o/r", "n": 1}\n'
+
+
+def test_config_is_parsed_once_until_the_file_changes(tmp_path, monkeypatch):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(CONFIG_YAML)
+    parses = []
+    real_load = github_pr_fetcher.yaml.load
+    monkeypatch.setattr(github_pr_fetcher.yaml, "load", lambda *a, **kw: parses.append(1) or real_load(*a, **kw))
+
+    config = github_pr_fetcher.load_config(str(config_path))
+    config['data_paths']['raw'] = "mutated"
+    assert github_pr_fetcher.load_config(str(config_path))['data_paths']['raw'] == "raw/"
+    assert len(parses) == 1
+
+    config_path.write_text(CONFIG_YAML.replace("raw: raw/", "raw: raw_v2/"))
+    assert github_pr_fetcher.load_config(str(config_path))['data_paths']['raw'] == "raw_v2/"
+    assert len(parses) == 2
+
+
+def read_checkpoint_lines(checkpoint_path):
+    return [json.loads(line) for line in checkpoint_path.read_text().splitlines()]
+
+
+def test_checkpoint_with_torn_last_line_keeps_earlier_entries(tmp_path):
+    checkpoint_path = tmp_path / github_pr_fetcher.CHECKPOINT_FILENAME
+    checkpoint_path.write_text('{"r": "o/r", "n": 1}\n{"r": "o/r", "n": 2}\n{"r": "o/r", "n"')
+
+    assert github_pr_fetcher.load_checkpoint(checkpoint_path) == {"o/r": {1, 2}}
+    # Compacted without the torn line, so later appends start on a clean line
+    assert read_checkpoint_lines(checkpoint_path) == [{"r": "o/r", "n": 1}, {"r": "o/r", "n": 2}]
+
+
+def test_legacy_snapshot_checkpoint_is_migrated_to_log(tmp_path):
+    checkpoint_path = tmp_path / github_pr_fetcher.CHECKPOINT_FILENAME
+    checkpoint_path.write_text(json.dumps({"o/r": [2, 1], "o/s": [3]}))
+
+    assert github_pr_fetcher.load_checkpoint(checkpoint_path) == {"o/r": {1, 2}, "o/s": {3}}
+    assert read_checkpoint_lines(checkpoint_path) == [
+        {"r": "o/r", "n": 1}, {"r": "o/r", "n": 2}, {"r": "o/s", "n": 3}]
+
+
+def test_duplicate_heavy_checkpoint_log_is_compacted(tmp_path):
+    checkpoint_path = tmp_path / github_pr_fetcher.CHECKPOINT_FILENAME
+    checkpoint_path.write_text('{"r": "o/r", "n": 1}\n' * 5 + '{"r": "o/r", "n": 2}\n')
+
+    assert github_pr_fetcher.load_checkpoint(checkpoint_path) == {"o/r": {1, 2}}
+    assert read_checkpoint_lines(checkpoint_path) == [{"r": "o/r", "n": 1}, {"r": "o/r", "n": 2}]
+
+
+def test_compact_checkpoint_log_is_not_rewritten(tmp_path):
+    checkpoint_path = tmp_path / github_pr_fetcher.CHECKPOINT_FILENAME
+    checkpoint_path.write_text('{"r": "o/r", "n": 2}\n{"r": "o/r", "n": 1}\n')
+
+    assert github_pr_fetcher.load_checkpoint(checkpoint_path) == {"o/r": {1, 2}}
+    assert checkpoint_path.read_text() == '{"r": "o/r", "n": 2}\n{"r": "o/r", "n": 1}\n'
+
+
+def test_rate_limit_wait_only_when_chunk_does_not_fit(monkeypatch):
+    monkeypatch.setattr(github_pr_fetcher, "rest_rate_limit_state",
+                        {"remaining": 300, "limit": 5000, "reset": time.time() + 3000, "polled_at": 0.0})
+    sleeps = []
+    monkeypatch.setattr(github_pr_fetcher.time, "sleep", sleeps.append)
+    session = FailingRateLimitSession()
+
+    github_pr_fetcher.wait_for_rate_limit_budget(session, 0)
+    github_pr_fetcher.wait_for_rate_limit_budget(session, 200)
+    assert session.calls == 0 and sleeps == [] # Well below the limit, but the chunk fits
+
+    github_pr_fetcher.wait_for_rate_limit_budget(session, 400)
+    assert len(sleeps) == 1
+
+
+def test_checkpoint_matching_ignores_owner_repo_case(tmp_path):
+    checkpoint_path = tmp_path / github_pr_fetcher.CHECKPOINT_FILENAME
+    checkpoint_path.write_text('{"r": "Foo/Bar", "n": 1}\n')
+    processed = github_pr_fetcher.load_checkpoint(checkpoint_path)
+
+    grouped, parsed_prs = github_pr_fetcher.group_prs_by_repository(
+        ["https://github.com/foo/bar/pull/1", "https://github.com/FOO/bar/pull/2"], processed)
+    assert [info['pr_number'] for infos in grouped.values() for info in infos] == [2]
+
+    newly_checkpointed = github_pr_fetcher.checkpoint_fetched_prs(checkpoint_path, processed, grouped)
+    processed_flat = {("foo", "bar", 1)} | set(newly_checkpointed)
+    assert set(parsed_prs) - processed_flat == set()
+    assert github_pr_fetcher.load_checkpoint(checkpoint_path) == {"foo/bar": {1, 2}}
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import run_online_evaluation
+
+REMOTE_TARGET = "remote:bucket/online/"
+
+
+def write_output(directory, name):
+    output_file = directory / name
+    output_file.write_text('{"hunk": 1}\n')
+    return output_file
+
+
+def read_manifest(staging_dir):
+    manifest_path = staging_dir / run_online_evaluation.STAGED_UPLOADS_MANIFEST
+    return manifest_path.read_text().split() if manifest_path.exists() else []
+
+
+def test_staging_during_flush_is_kept_for_next_flush(tmp_path, monkeypatch):
+    staging_dir = tmp_path / run_online_evaluation.STAGED_UPLOADS_DIRNAME
+    run_online_evaluation.stage_for_batch_upload(write_output(tmp_path, "first_hunks.jsonl"), staging_dir)
+    uploaded_batches = []
+
+    def fake_rclone(args_list, suppress_output=False):
+        manifest = args_list[args_list.index('--files-from') + 1]
+        with open(manifest) as f:
+            uploaded_batches.append(f.read().split())
+        # Another --batch-uploads run stages a PR while this upload is in flight
+        if len(uploaded_batches) == 1:
+            run_online_evaluation.stage_for_batch_upload(write_output(tmp_path, "second_hunks.jsonl"), staging_dir)
+        return True, ""
+
+    monkeypatch.setattr(run_online_evaluation, "run_rclone_command", fake_rclone)
+
+    assert run_online_evaluation.flush_staged_uploads(REMOTE_TARGET, staging_dir)
+    assert uploaded_batches == [["first_hunks.jsonl"]]
+    assert not (staging_dir / "first_hunks.jsonl").exists()
+    assert (staging_dir / "second_hunks.jsonl").exists()
+    assert read_manifest(staging_dir) == ["second_hunks.jsonl"]
+
+    assert run_online_evaluation.flush_staged_uploads(REMOTE_TARGET, staging_dir)
+    assert uploaded_batches[1] == ["second_hunks.jsonl"]
+    assert list(staging_dir.iterdir()) == []
+
+
+def test_failed_flush_keeps_files_listed_for_next_flush(tmp_path, monkeypatch):
+    staging_dir = tmp_path / run_online_evaluation.STAGED_UPLOADS_DIRNAME
+    run_online_evaluation.stage_for_batch_upload(write_output(tmp_path, "first_hunks.jsonl"), staging_dir)
+    monkeypatch.setattr(run_online_evaluation, "run_rclone_command", lambda args_list, suppress_output=False: (False, "boom"))
+
+    assert not run_online_evaluation.flush_staged_uploads(REMOTE_TARGET, staging_dir)
+    assert (staging_dir / "first_hunks.jsonl").exists()
+    assert read_manifest(staging_dir) == ["first_hunks.jsonl"]
+    assert not list(staging_dir.glob("*.flushing"))
+
+
+def test_process_pr_reports_step_exception_as_failure(tmp_path, monkeypatch):
+    args = SimpleNamespace(config="config.yaml", intermediate_dir=str(tmp_path), debug=False,
+                           subprocess=False, batch_uploads=False)
+
+    def failing_step(script_name, args_list):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(run_online_evaluation, "run_script_inproc", failing_step)
+
+    results = [run_online_evaluation.process_pr(pr_id, args, REMOTE_TARGET) for pr_id in ("o/r/1", "o/r/2")]
+    assert results == [False, False]
+    assert list(tmp_path.iterdir()) == [] # Intermediate dirs are still cleaned up
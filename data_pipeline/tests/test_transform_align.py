@@ -0,0 +1,47 @@
+from transform_align import build_diff_index, find_hunk_and_line_for_comment
+
+GIT_DIFF = """diff --git a/x.py b/x.py
+--- a/x.py
++++ b/x.py
+@@ -1,2 +1,3 @@
+ a
++b
+ c
+diff --git a/y.py b/y.py
+--- a/y.py
++++ b/y.py
+@@ -1,2 +1,3 @@
+ d
++e
+ f
+"""
+
+# Same two files as a plain unified diff, without 'diff --git' headers
+PLAIN_DIFF = """--- a/x.py
++++ b/x.py
+@@ -1,2 +1,3 @@
+ a
++b
+ c
+--- a/y.py
++++ b/y.py
+@@ -1,2 +1,3 @@
+ d
++e
+ f
+"""
+
+
+def test_git_diff_indexes_every_file():
+    diff_index = build_diff_index(GIT_DIFF)
+    patched_file, hunk, line = find_hunk_and_line_for_comment(diff_index, 'y.py', 2)
+    assert patched_file.path == 'y.py'
+    assert line.is_added and line.value == 'e\n'
+
+
+def test_plain_multi_file_diff_indexes_every_file():
+    diff_index = build_diff_index(PLAIN_DIFF)
+    for path, added in (('x.py', 'b\n'), ('y.py', 'e\n')):
+        patched_file, hunk, line = find_hunk_and_line_for_comment(diff_index, path, 2)
+        assert patched_file is not None, path
+        assert line.is_added and line.value == added
@@ -3,6 +3,7 @@ import re
 import argparse
 import json
 import yaml
+from yaml_loader import YamlSafeLoader
 import sys
 import time
 from pathlib import Path
@@ -14,7 +15,7 @@ def load_config(config_path):
     """Loads the YAML configuration file."""
     try:
         with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=YamlSafeLoader)
         if not config:
             raise ValueError("Config file is empty.")
         # We don't strictly need paths from config here, but could validate
@@ -41,52 +42,104 @@ def parse_owner_repo_pr_from_filename(filename):
         return match.groups()
     return None, None, None
 
-def find_hunk_and_line_for_comment(parsed_diff, comment_path, comment_pos):
+# Start of each file's section in a git diff; content lines always begin with '+', '-', ' ' or '\\'
+DIFF_FILE_HEADER_PATTERN = re.compile(r"^diff --git ", re.MULTILINE)
+
+def split_diff_by_file(diff_text):
+    """
+    Splits a git diff into one text chunk per file, without parsing the hunks.
+    Returns None for a diff without 'diff --git' headers, which has to be parsed whole.
+    """
+    starts = [match.start() for match in DIFF_FILE_HEADER_PATTERN.finditer(diff_text)]
+    if not starts:
+        return None
+    return [diff_text[start:end] for start, end in zip(starts, starts[1:] + [len(diff_text)])]
+
+def build_diff_index(diff_text):
+    """
+    Indexes a PR's diff once so comment lookups don't rescan it.
+    Only each file's header is parsed up front; a file's hunks are parsed the first time
+    a comment refers to it (see resolve_diff_entry), so files nobody commented on are never parsed.
+    Maps every path variant of each file (path, source_file, target_file) to that file's entry.
+    A diff without git file headers can't be split, so it is parsed whole and every file indexed fully parsed.
+    """
+    file_texts = split_diff_by_file(diff_text)
+    if file_texts is None:
+        # 'text': None marks the header as the fully parsed file (see resolve_diff_entry)
+        indexed_files = [(patched_file, None) for patched_file in PatchSet(StringIO(diff_text))]
+    else:
+        indexed_files = []
+        for file_text in file_texts:
+            hunks_start = file_text.find('\n@@')
+            header_files = PatchSet(StringIO(file_text[:hunks_start + 1] if hunks_start != -1 else file_text))
+            if len(header_files) != 1:
+                header_files = PatchSet(StringIO(file_text)) # Unusual header; parse the chunk fully
+            indexed_files.extend((header_file, file_text) for header_file in header_files)
+
+    diff_index = {}
+    for header_file, file_text in indexed_files:
+        entry = {'header': header_file, 'text': file_text, 'resolved': None}
+        # unidiff paths might start with 'a/' or 'b/' - index all variants to match flexibly.
+        # setdefault keeps the first file for a key, like the first match of a linear scan.
+        for key in (header_file.source_file, header_file.target_file, header_file.path):
+            diff_index.setdefault(key, entry)
+    return diff_index
+
+def resolve_diff_entry(entry):
+    """
+    Parses an indexed file's hunks on first use and returns (patched_file, positions),
+    where positions[i] is the (hunk, line) at comment position i + 1.
+    """
+    if entry['resolved'] is None:
+        header_file = entry['header']
+        if entry['text'] is None:
+            file_diff = header_file # Already parsed with its hunks
+        else:
+            file_diff = next(
+                (parsed for parsed in PatchSet(StringIO(entry['text']))
+                 if parsed.source_file == header_file.source_file and parsed.target_file == header_file.target_file),
+                header_file
+            )
+        # Position in comments refers to the line number within the *diff view* of that file,
+        # counting only added and context lines. It's a 1-based index.
+        positions = [(hunk, line) for hunk in file_diff for line in hunk if line.is_context or line.is_added]
+        entry['resolved'] = (file_diff, positions)
+        entry['text'] = None # Parsed; the raw chunk is no longer needed
+    return entry['resolved']
+
+def find_hunk_and_line_for_comment(diff_index, comment_path, comment_pos):
     """
-    Finds the specific hunk and line object in the parsed diff corresponding
-    to a comment path and position (1-based index within the file's diff).
+    Finds the specific hunk and line object in the indexed diff (see build_diff_index)
+    corresponding to a comment path and position (1-based index within the file's diff).
     Returns a tuple (patched_file, hunk, line) or (None, None, None) if not found.
     """
     if not comment_path or comment_pos is None or comment_pos <= 0:
         print(f"Debug: Invalid comment_path ('{comment_path}') or comment_pos ({comment_pos})")
         return None, None, None
 
-    patched_file_obj = None # This will store the PatchedFile object
-    # Find the file in the parsed diff that matches the comment's path
-    for file_diff in parsed_diff: # file_diff is a PatchedFile
-        # unidiff paths might start with 'a/' or 'b/' - try to match flexibly
-        if file_diff.source_file == comment_path or \
-           file_diff.target_file == comment_path or \
-           file_diff.path == comment_path: # path attribute combines source/target heuristically
-            patched_file_obj = file_diff
-            break
+    entry = diff_index.get(comment_path)
+    if entry is None:
         # Fallback: Check if the comment path is a suffix of the unidiff path
         # (e.g., comment path 'src/main.py', unidiff path 'b/src/main.py')
-        elif comment_path and (file_diff.source_file.endswith('/' + comment_path) or \
-                              file_diff.target_file.endswith('/' + comment_path)):
-             print(f"Debug: Matched comment path '{comment_path}' as suffix of diff path '{file_diff.path}'")
-             patched_file_obj = file_diff
-             break
+        for candidate in diff_index.values():
+            header_file = candidate['header']
+            if header_file.source_file.endswith('/' + comment_path) or \
+               header_file.target_file.endswith('/' + comment_path):
+                print(f"Debug: Matched comment path '{comment_path}' as suffix of diff path '{header_file.path}'")
+                entry = candidate
+                break
 
-    if not patched_file_obj:
+    if entry is None:
         print(f"Debug: Could not find file matching path '{comment_path}' in the diff.")
         return None, None, None
 
-    # Position in comments refers to the line number within the *diff view* of that file,
-    # counting only added and context lines. It's a 1-based index.
-    current_pos_count = 0
-    for hunk in patched_file_obj: # Iterate through hunks of the found PatchedFile
-        for line in hunk: # Iterate through lines within the hunk
-            # Only count lines that appear in the final diff view that positions usually refer to
-            if line.is_context or line.is_added:
-                current_pos_count += 1
-                if current_pos_count == comment_pos:
-                    # Found the line, return the PatchedFile, Hunk, and Line
-                    return patched_file_obj, hunk, line
-
-    # If loop completes without finding the position
-    print(f"Debug: Comment position {comment_pos} not found in file '{comment_path}' (max pos checked: {current_pos_count}). This might indicate an outdated comment or position mismatch.")
-    return None, None, None
+    patched_file_obj, positions = resolve_diff_entry(entry)
+    if comment_pos > len(positions):
+        print(f"Debug: Comment position {comment_pos} not found in file '{comment_path}' (max pos checked: {len(positions)}). This might indicate an outdated comment or position mismatch.")
+        return None, None, None
+
+    hunk, line = positions[comment_pos - 1]
+    return patched_file_obj, hunk, line
 
 def get_line_type(line):
     """Determines the type of a diff line."""
@@ -105,9 +158,8 @@ def process_pr_files(diff_path, comments_path, output_path, debug=False):
         # Read and parse the diff file
         with open(diff_path, 'r', encoding='utf-8') as f_diff:
             diff_text = f_diff.read()
-        # Use StringIO because PatchSet expects a file-like object or string iterator
-        # diff_text is already a string, so no encoding needed for PatchSet here.
-        parsed_diff = PatchSet(StringIO(diff_text))
+        # Files are parsed lazily, only when a comment refers to them
+        diff_index = build_diff_index(diff_text)
 
         # Read the comments JSONL file
         with open(comments_path, 'r', encoding='utf-8') as f_comments:
@@ -140,7 +192,7 @@ def process_pr_files(diff_path, comments_path, output_path, debug=False):
 
                 # Find the corresponding line in the parsed diff
                 # Now expecting patched_file, hunk, and diff_line
-                matched_patched_file, hunk, diff_line = find_hunk_and_line_for_comment(parsed_diff, comment_path, comment_pos)
+                matched_patched_file, hunk, diff_line = find_hunk_and_line_for_comment(diff_index, comment_path, comment_pos)
 
                 if matched_patched_file and hunk and diff_line: # Check all three
                     line_type = get_line_type(diff_line)
@@ -0,0 +1,7 @@
+"""YAML loader shared by the pipeline scripts."""
+
+# libyaml's C loader when PyYAML was built with it; same safe semantics as yaml.safe_load
+try:
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader